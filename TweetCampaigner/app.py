@@ -3,6 +3,7 @@ import logging
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from flask_compress import Compress
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 
@@ -22,15 +23,25 @@ app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 # Configure the database
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
 app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
+    # Sized for gevent workers running many requests per process
+    "pool_size": 20,
+    "max_overflow": 40,
+    "pool_recycle": 1800,
     "pool_pre_ping": True,
+    "insertmanyvalues_page_size": 1000,
+    # Room for every distinct statement shape, so SQL is compiled once per process
+    "query_cache_size": 1200,
 }
+if (app.config["SQLALCHEMY_DATABASE_URI"] or "").startswith("postgres"):
+    # Naive timestamps (scheduled_time, posted_at) are UTC, so the session must read them as UTC
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"]["connect_args"] = {"options": "-c timezone=utc"}
 
 # Initialize extensions
 db.init_app(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
+Compress(app)
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -5,10 +5,22 @@ from celery import Celery
 broker_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
 result_backend = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
 
+# The Redis instance is shared with the app cache, keep result keys apart
+result_backend_transport_options = {'global_keyprefix': 'tc:'}
+
+# Unacked messages are redelivered after the visibility timeout (default is 1 hour).
+# Posting tasks can be queued days ahead, so a held ETA message is redelivered every
+# 12 hours until it runs. Those duplicates are expected: schedule_tweet_task only posts
+# a tweet that is still 'scheduled', is not locked by another worker and carries the
+# running task's id, which is what keeps redelivery from posting twice.
+broker_transport_options = {'visibility_timeout': 43200}
+
 # Task settings
-task_serializer = 'json'
-result_serializer = 'json'
-accept_content = ['json']
+# Task args are a few ids, msgpack keeps them smaller and faster to decode than JSON.
+# JSON is still accepted for posting tasks queued with an ETA before the switch.
+task_serializer = 'msgpack'
+result_serializer = 'msgpack'
+accept_content = ['msgpack', 'json']
 result_expires = 3600
 timezone = 'UTC'
 enable_utc = True
@@ -20,10 +32,18 @@ task_routes = {
     'tasks.refresh_trending_hashtags': {'queue': 'background'},
     'tasks.cleanup_old_data': {'queue': 'background'},
     'tasks.batch_analytics_update': {'queue': 'analytics'},
+    'tasks.refresh_daily_analytics': {'queue': 'background'},
+    'tasks.release_stale_posts': {'queue': 'background'},
+    'tasks.refresh_campaign_insights': {'queue': 'background'},
 }
 
 # Worker settings
-worker_prefetch_multiplier = 1
+# Prefetch is tuned per worker, by queue: long-running posting/analytics tasks
+# take one message at a time, short maintenance tasks can prefetch more.
+# Posting and analytics tasks spend their time waiting on Twitter/Gemini, so
+# they run on eventlet green threads; background jobs keep the prefork pool.
+#   celery -A tasks worker -Q tweet_posting,analytics -P eventlet -c 25 --prefetch-multiplier=1
+#   celery -A tasks worker -Q background --prefetch-multiplier=4
 task_acks_late = True
 worker_disable_rate_limits = False
 
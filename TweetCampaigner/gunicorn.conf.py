@@ -0,0 +1,16 @@
+import os
+
+# Loaded automatically when gunicorn is started from this directory:
+#   gunicorn main:app
+bind = "0.0.0.0:5000"
+
+# Request handlers mostly wait on the database, Twitter and Gemini, so each
+# worker process serves many requests concurrently on gevent greenlets
+worker_class = "gevent"
+workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+worker_connections = 200
+
+def post_fork(server, worker):
+    # gevent patches sockets, psycopg2 needs its own wait callback to yield on queries
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
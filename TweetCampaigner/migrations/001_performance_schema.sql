@@ -0,0 +1,121 @@
+-- Brings a PostgreSQL database created by db.create_all() before the performance work
+-- up to the current models. New databases get this schema from db.create_all() directly.
+-- It may run after the new code has booted: db.create_all() and the after_create hook in
+-- models.py will then already have created campaign_stats and mv_user_daily_analytics.
+-- Run once, before 002_performance_indexes.sql:
+--   psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -f migrations/001_performance_schema.sql
+
+BEGIN;
+
+SET LOCAL timezone = 'UTC';
+
+-- Timestamps are timestamptz filled by the database; the stored naive values are UTC
+ALTER TABLE "user"
+    ALTER COLUMN created_at TYPE timestamptz USING created_at AT TIME ZONE 'UTC',
+    ALTER COLUMN created_at SET DEFAULT now();
+
+ALTER TABLE campaign
+    ALTER COLUMN created_at TYPE timestamptz USING created_at AT TIME ZONE 'UTC',
+    ALTER COLUMN created_at SET DEFAULT now(),
+    ALTER COLUMN updated_at TYPE timestamptz USING updated_at AT TIME ZONE 'UTC',
+    ALTER COLUMN updated_at SET DEFAULT now();
+
+ALTER TABLE tweet_template
+    ALTER COLUMN created_at TYPE timestamptz USING created_at AT TIME ZONE 'UTC',
+    ALTER COLUMN created_at SET DEFAULT now();
+
+ALTER TABLE scheduled_tweet
+    ALTER COLUMN created_at TYPE timestamptz USING created_at AT TIME ZONE 'UTC',
+    ALTER COLUMN created_at SET DEFAULT now();
+
+ALTER TABLE tweet_analytics
+    ALTER COLUMN last_updated TYPE timestamptz USING last_updated AT TIME ZONE 'UTC',
+    ALTER COLUMN last_updated SET DEFAULT now();
+
+ALTER TABLE trending_hashtag
+    ALTER COLUMN created_at TYPE timestamptz USING created_at AT TIME ZONE 'UTC',
+    ALTER COLUMN created_at SET DEFAULT now(),
+    ALTER COLUMN updated_at TYPE timestamptz USING updated_at AT TIME ZONE 'UTC',
+    ALTER COLUMN updated_at SET DEFAULT now();
+
+-- Keywords and hashtags become JSONB lists. Template campaigns stored JSON text, the old
+-- create form stored the raw input, which is split the way the form now splits it.
+ALTER TABLE campaign
+    ALTER COLUMN keywords TYPE jsonb USING CASE
+        WHEN keywords LIKE '[%' THEN keywords::jsonb
+        ELSE to_jsonb(array_remove(regexp_split_to_array(btrim(keywords), '\s*,\s*'), ''))
+    END,
+    ALTER COLUMN hashtags TYPE jsonb USING CASE
+        WHEN hashtags LIKE '[%' THEN hashtags::jsonb
+        ELSE to_jsonb(array_remove(regexp_split_to_array(btrim(hashtags), '[\s,]+'), ''))
+    END;
+
+-- Posting bookkeeping; tweets queued before the upgrade keep a NULL task_id, which
+-- schedule_tweet_task accepts
+ALTER TABLE scheduled_tweet
+    ADD COLUMN task_id VARCHAR(155),
+    ADD COLUMN claimed_at TIMESTAMP WITHOUT TIME ZONE;
+
+-- One analytics row per tweet, keeping the most recent duplicate
+DELETE FROM tweet_analytics older
+USING tweet_analytics newer
+WHERE older.tweet_id = newer.tweet_id
+  AND older.user_id = newer.user_id
+  AND older.id < newer.id;
+
+ALTER TABLE tweet_analytics
+    ADD CONSTRAINT uq_tweet_analytics_tweet_user UNIQUE (tweet_id, user_id);
+
+-- Engagement figures are computed by the database
+ALTER TABLE tweet_analytics DROP COLUMN engagement_rate;
+ALTER TABLE tweet_analytics
+    ADD COLUMN total_engagement INTEGER GENERATED ALWAYS AS (likes + retweets + replies) STORED,
+    ADD COLUMN engagement_rate FLOAT GENERATED ALWAYS AS (COALESCE(CAST(likes + retweets + replies AS DOUBLE PRECISION) * 100 / NULLIF(impressions, 0), 0)) STORED;
+
+-- Trending hashtags are upserted by name, keeping the most recent duplicate
+DELETE FROM trending_hashtag older
+USING trending_hashtag newer
+WHERE older.hashtag = newer.hashtag
+  AND older.id < newer.id;
+
+ALTER TABLE trending_hashtag
+    ADD CONSTRAINT trending_hashtag_hashtag_key UNIQUE (hashtag);
+
+-- Engagement rollup per user, campaign and posting day, backfilled from the existing analytics
+CREATE TABLE IF NOT EXISTS campaign_stats (
+    user_id INTEGER NOT NULL,
+    campaign_id INTEGER NOT NULL,
+    day DATE NOT NULL,
+    likes INTEGER,
+    retweets INTEGER,
+    replies INTEGER,
+    total_engagement INTEGER,
+    impressions INTEGER,
+    tweet_count INTEGER,
+    PRIMARY KEY (user_id, campaign_id, day),
+    FOREIGN KEY (user_id) REFERENCES "user" (id)
+);
+
+INSERT INTO campaign_stats (user_id, campaign_id, day, likes, retweets, replies,
+                            total_engagement, impressions, tweet_count)
+SELECT ta.user_id, COALESCE(ta.campaign_id, 0), date(st.posted_at),
+       sum(ta.likes), sum(ta.retweets), sum(ta.replies),
+       sum(ta.total_engagement), sum(ta.impressions), count(ta.id)
+FROM tweet_analytics ta
+JOIN scheduled_tweet st ON st.tweet_id = ta.tweet_id AND st.user_id = ta.user_id
+WHERE st.posted_at IS NOT NULL
+GROUP BY ta.user_id, COALESCE(ta.campaign_id, 0), date(st.posted_at)
+ON CONFLICT (user_id, campaign_id, day) DO NOTHING;
+
+-- Daily activity view, same definition as the after_create hook in models.py
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_user_daily_analytics AS
+SELECT st.user_id, date(st.posted_at) AS d, count(*) AS posts,
+       sum(ta.likes) AS likes, sum(ta.retweets) AS retweets
+FROM scheduled_tweet st
+LEFT JOIN tweet_analytics ta ON st.tweet_id = ta.tweet_id
+WHERE st.status = 'posted'
+GROUP BY st.user_id, date(st.posted_at);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ix_mv_user_daily_analytics ON mv_user_daily_analytics (user_id, d);
+
+COMMIT;
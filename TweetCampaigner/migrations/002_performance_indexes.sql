@@ -0,0 +1,40 @@
+-- Indexes for the current models, built without blocking writes.
+-- CREATE INDEX CONCURRENTLY cannot run in a transaction block, so run this file
+-- without --single-transaction, after 001_performance_schema.sql:
+--   psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -f migrations/002_performance_indexes.sql
+
+-- Superseded scheduled_tweet indexes from earlier revisions of the models. Each one
+-- contained status, which kept every status transition from being a HOT update.
+DROP INDEX CONCURRENTLY IF EXISTS ix_tweet_user_status;
+DROP INDEX CONCURRENTLY IF EXISTS ix_tweet_user_status_created;
+DROP INDEX CONCURRENTLY IF EXISTS ix_tweet_campaign_status;
+DROP INDEX CONCURRENTLY IF EXISTS ix_st_campaign_created_status;
+DROP INDEX CONCURRENTLY IF EXISTS ix_tweet_status_posted;
+-- ix_tweet_user_created used to INCLUDE status
+DROP INDEX CONCURRENTLY IF EXISTS ix_tweet_user_created;
+-- The stale posting sweep now scans ix_tweet_claimed_at
+DROP INDEX CONCURRENTLY IF EXISTS ix_tweet_scheduled_time;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_campaign_user_created ON campaign (user_id, created_at);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tweet_user_created ON scheduled_tweet (user_id, created_at);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tweet_campaign_created ON scheduled_tweet (campaign_id, created_at);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tweet_posted_at ON scheduled_tweet (posted_at);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tweet_tweet_id ON scheduled_tweet (tweet_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tweet_claimed_at ON scheduled_tweet (claimed_at)
+    WHERE claimed_at IS NOT NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_ta_user_engagement ON tweet_analytics (user_id, engagement_rate DESC)
+    INCLUDE (likes, retweets, replies, impressions, tweet_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_campaign_stats_user_day ON campaign_stats (user_id, day)
+    INCLUDE (likes, retweets, replies, total_engagement, impressions, tweet_count);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_trending_rank ON trending_hashtag (trend_rank);
+
+-- Fresh statistics, and a visibility map so the INCLUDE indexes give index-only scans
+VACUUM ANALYZE campaign;
+VACUUM ANALYZE scheduled_tweet;
+VACUUM ANALYZE tweet_analytics;
+VACUUM ANALYZE campaign_stats;
+VACUUM ANALYZE trending_hashtag;
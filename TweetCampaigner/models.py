@@ -1,8 +1,13 @@
-from datetime import datetime
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import func, Computed, DDL, event
+from sqlalchemy.dialects.postgresql import JSONB
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+from werkzeug.security import check_password_hash
 from app import db
 
+password_hasher = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=2)
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -10,17 +15,31 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(256), nullable=False)
     twitter_access_token = db.Column(db.String(500))
     twitter_access_token_secret = db.Column(db.String(500))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
     
     # Relationships
     campaigns = db.relationship('Campaign', backref='user', lazy=True, cascade='all, delete-orphan')
     tweets = db.relationship('ScheduledTweet', backref='user', lazy=True, cascade='all, delete-orphan')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        # Accounts created before the switch to argon2 carry Werkzeug hashes, upgrade them on login
+        if not self.password_hash.startswith('$argon2'):
+            if not check_password_hash(self.password_hash, password):
+                return False
+            self.set_password(password)
+            return True
+        
+        try:
+            password_hasher.verify(self.password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+        
+        if password_hasher.check_needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
     
     def has_twitter_auth(self):
         return self.twitter_access_token and self.twitter_access_token_secret
@@ -29,15 +48,19 @@ class Campaign(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
-    keywords = db.Column(db.Text)  # JSON string of keywords
-    hashtags = db.Column(db.Text)  # JSON string of hashtags
+    keywords = db.Column(db.JSON().with_variant(JSONB, 'postgresql'))  # list of keywords
+    hashtags = db.Column(db.JSON().with_variant(JSONB, 'postgresql'))  # list of hashtags
     target_audience = db.Column(db.String(500))
     tweet_frequency = db.Column(db.Integer, default=3)  # tweets per day
     is_active = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
+    updated_at = db.Column(db.DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     
+    __table_args__ = (
+        db.Index('ix_campaign_user_created', 'user_id', 'created_at'),
+    )
+    
     # Relationships
     tweets = db.relationship('ScheduledTweet', backref='campaign', lazy=True, cascade='all, delete-orphan')
     analytics = db.relationship('TweetAnalytics', backref='campaign', lazy=True, cascade='all, delete-orphan')
@@ -49,19 +72,32 @@ class TweetTemplate(db.Model):
     category = db.Column(db.String(100))
     is_active = db.Column(db.Boolean, default=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
 
 class ScheduledTweet(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     scheduled_time = db.Column(db.DateTime, nullable=False)
-    status = db.Column(db.String(50), default='scheduled')  # scheduled, posted, failed, cancelled
+    status = db.Column(db.String(50), default='scheduled')  # scheduled, posting, posted, failed, cancelled
     tweet_id = db.Column(db.String(100))  # Twitter tweet ID after posting
     error_message = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
     posted_at = db.Column(db.DateTime)
+    task_id = db.Column(db.String(155))  # Celery id of the queued posting task
+    claimed_at = db.Column(db.DateTime)  # when the posting attempt in flight started, cleared when it ends
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id'))
+    
+    __table_args__ = (
+        # status is left out of every index so status transitions stay HOT updates
+        db.Index('ix_tweet_user_created', 'user_id', 'created_at'),
+        db.Index('ix_tweet_campaign_created', 'campaign_id', 'created_at'),
+        # Recently posted tweets for the batch analytics refresh and cleanup
+        db.Index('ix_tweet_posted_at', 'posted_at'),
+        db.Index('ix_tweet_tweet_id', 'tweet_id'),
+        # Attempts in flight, for the stale posting sweep
+        db.Index('ix_tweet_claimed_at', 'claimed_at', postgresql_where=db.text('claimed_at IS NOT NULL')),
+    )
 
 class TweetAnalytics(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -70,16 +106,67 @@ class TweetAnalytics(db.Model):
     retweets = db.Column(db.Integer, default=0)
     replies = db.Column(db.Integer, default=0)
     impressions = db.Column(db.Integer, default=0)
-    engagement_rate = db.Column(db.Float, default=0.0)
-    last_updated = db.Column(db.DateTime, default=datetime.utcnow)
+    # Maintained by the database whenever the metrics change
+    total_engagement = db.Column(db.Integer, Computed("likes + retweets + replies", persisted=True))
+    engagement_rate = db.Column(db.Float, Computed(  # percentage of impressions
+        "COALESCE(CAST(likes + retweets + replies AS DOUBLE PRECISION) * 100 / NULLIF(impressions, 0), 0)",
+        persisted=True
+    ))
+    last_updated = db.Column(db.DateTime(timezone=True), server_default=func.now())
     campaign_id = db.Column(db.Integer, db.ForeignKey('campaign.id'))
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('tweet_id', 'user_id', name='uq_tweet_analytics_tweet_user'),
+        # Top-N by engagement straight from the index, the metrics ride along in INCLUDE
+        db.Index('ix_ta_user_engagement', 'user_id', db.text('engagement_rate DESC'),
+                 postgresql_include=['likes', 'retweets', 'replies', 'impressions', 'tweet_id']),
+    )
+
+class CampaignStats(db.Model):
+    """Engagement totals per user, campaign and posting day, recomputed whenever analytics are written"""
+    __tablename__ = 'campaign_stats'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    campaign_id = db.Column(db.Integer, primary_key=True)  # 0 for tweets outside a campaign
+    day = db.Column(db.Date, primary_key=True)
+    likes = db.Column(db.Integer, default=0)
+    retweets = db.Column(db.Integer, default=0)
+    replies = db.Column(db.Integer, default=0)
+    total_engagement = db.Column(db.Integer, default=0)
+    impressions = db.Column(db.Integer, default=0)
+    tweet_count = db.Column(db.Integer, default=0)
+    
+    __table_args__ = (
+        # Per-user totals over a day range without touching the heap
+        db.Index('ix_campaign_stats_user_day', 'user_id', 'day',
+                 postgresql_include=['likes', 'retweets', 'replies', 'total_engagement', 'impressions', 'tweet_count']),
+    )
 
 class TrendingHashtag(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    hashtag = db.Column(db.String(200), nullable=False)
+    hashtag = db.Column(db.String(200), nullable=False, unique=True)
     tweet_volume = db.Column(db.Integer)
     trend_rank = db.Column(db.Integer)
     location = db.Column(db.String(100), default='Global')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
+    updated_at = db.Column(db.DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        db.Index('ix_trending_rank', 'trend_rank'),
+    )
+
+# Daily posting totals per user for the analytics charts, refreshed by tasks.refresh_daily_analytics.
+# The unique index lets the view be refreshed concurrently.
+event.listen(db.metadata, 'after_create', DDL("""
+    CREATE MATERIALIZED VIEW IF NOT EXISTS mv_user_daily_analytics AS
+    SELECT st.user_id, date(st.posted_at) AS d, count(*) AS posts,
+           sum(ta.likes) AS likes, sum(ta.retweets) AS retweets
+    FROM scheduled_tweet st
+    LEFT JOIN tweet_analytics ta ON st.tweet_id = ta.tweet_id
+    WHERE st.status = 'posted'
+    GROUP BY st.user_id, date(st.posted_at)
+""").execute_if(dialect='postgresql'))
+event.listen(db.metadata, 'after_create', DDL(
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_mv_user_daily_analytics ON mv_user_daily_analytics (user_id, d)"
+).execute_if(dialect='postgresql'))
@@ -1,19 +1,24 @@
 from flask import render_template, request, redirect, url_for, flash, jsonify, session
 from flask_login import login_user, logout_user, login_required, current_user
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import json
 import logging
+from sqlalchemy import select, func, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import load_only
+from celery.utils import uuid
 
 from app import app, db
 from models import User, Campaign, ScheduledTweet, TweetTemplate, TweetAnalytics, TrendingHashtag
-from services.ai_service import AIService
-from services.twitter_service import TwitterService
+from services.ai_service import get_ai_service, fast_spam_prefilter
+from services.twitter_service import get_twitter_service
 from services.analytics_service import AnalyticsService
 from services.campaign_service import CampaignService
+from services import cache
 from tasks import schedule_tweet_task, collect_tweet_analytics
 
-ai_service = AIService()
-twitter_service = TwitterService()
+ai_service = get_ai_service()
+twitter_service = get_twitter_service()
 analytics_service = AnalyticsService()
 campaign_service = CampaignService()
 
@@ -26,12 +31,20 @@ def index():
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
+        # Reject brute-force traffic before spending any time hashing
+        if cache.hit_rate_limit(f"login:{request.remote_addr}", 5, 60):
+            flash('Too many login attempts. Please wait a minute and try again.', 'error')
+            return render_template('login.html'), 429
+        
         username = request.form['username']
         password = request.form['password']
         
         user = User.query.filter_by(username=username).first()
         
         if user and user.check_password(password):
+            # Persist the upgraded hash when check_password rehashed it
+            if user in db.session.dirty:
+                db.session.commit()
             login_user(user)
             next_page = request.args.get('next')
             return redirect(next_page) if next_page else redirect(url_for('dashboard'))
@@ -47,13 +60,16 @@ def register():
         email = request.form['email']
         password = request.form['password']
         
-        # Check if user already exists
-        if User.query.filter_by(username=username).first():
-            flash('Username already exists', 'error')
-            return render_template('register.html')
+        # Check if user already exists, reading only the two unique columns
+        existing = db.session.query(User.username, User.email).filter(
+            or_(User.username == username, User.email == email)
+        ).first()
         
-        if User.query.filter_by(email=email).first():
-            flash('Email already registered', 'error')
+        if existing:
+            if existing.username == username:
+                flash('Username already exists', 'error')
+            else:
+                flash('Email already registered', 'error')
             return render_template('register.html')
         
         # Create new user
@@ -66,6 +82,10 @@ def register():
             login_user(user)
             flash('Registration successful!', 'success')
             return redirect(url_for('dashboard'))
+        except IntegrityError:
+            # Lost a race with a concurrent registration for the same username/email
+            db.session.rollback()
+            flash('Username or email already registered', 'error')
         except Exception as e:
             db.session.rollback()
             flash('Registration failed. Please try again.', 'error')
@@ -82,26 +102,43 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    # Get user statistics
-    total_campaigns = Campaign.query.filter_by(user_id=current_user.id).count()
-    active_campaigns = Campaign.query.filter_by(user_id=current_user.id, is_active=True).count()
-    total_tweets = ScheduledTweet.query.filter_by(user_id=current_user.id).count()
-    posted_tweets = ScheduledTweet.query.filter_by(user_id=current_user.id, status='posted').count()
+    # Get user statistics in a single round-trip
+    user_campaigns = select(func.count(Campaign.id)).where(Campaign.user_id == current_user.id)
+    user_tweets = select(func.count(ScheduledTweet.id)).where(ScheduledTweet.user_id == current_user.id)
+    stats = db.session.execute(select(
+        user_campaigns.scalar_subquery().label('total_campaigns'),
+        user_campaigns.where(Campaign.is_active.is_(True)).scalar_subquery().label('active_campaigns'),
+        user_tweets.scalar_subquery().label('total_tweets'),
+        user_tweets.where(ScheduledTweet.status == 'posted').scalar_subquery().label('posted_tweets')
+    )).one()
     
-    # Get recent campaigns
-    recent_campaigns = Campaign.query.filter_by(user_id=current_user.id).order_by(Campaign.created_at.desc()).limit(5).all()
+    # Get recent campaigns, loading only the columns the dashboard renders
+    recent_campaigns = db.session.scalars(
+        select(Campaign)
+        .options(load_only(Campaign.name, Campaign.is_active, Campaign.created_at))
+        .where(Campaign.user_id == current_user.id)
+        .order_by(Campaign.created_at.desc())
+        .limit(5)
+    ).all()
     
     # Get recent tweets
-    recent_tweets = ScheduledTweet.query.filter_by(user_id=current_user.id).order_by(ScheduledTweet.created_at.desc()).limit(10).all()
+    recent_tweets = db.session.scalars(
+        select(ScheduledTweet)
+        .options(load_only(ScheduledTweet.content, ScheduledTweet.status,
+                           ScheduledTweet.scheduled_time, ScheduledTweet.posted_at))
+        .where(ScheduledTweet.user_id == current_user.id)
+        .order_by(ScheduledTweet.created_at.desc())
+        .limit(10)
+    ).all()
     
     # Get trending hashtags
     trending_hashtags = TrendingHashtag.query.order_by(TrendingHashtag.trend_rank.asc()).limit(10).all()
     
     return render_template('dashboard.html', 
-                         total_campaigns=total_campaigns,
-                         active_campaigns=active_campaigns,
-                         total_tweets=total_tweets,
-                         posted_tweets=posted_tweets,
+                         total_campaigns=stats.total_campaigns,
+                         active_campaigns=stats.active_campaigns,
+                         total_tweets=stats.total_tweets,
+                         posted_tweets=stats.posted_tweets,
                          recent_campaigns=recent_campaigns,
                          recent_tweets=recent_tweets,
                          trending_hashtags=trending_hashtags)
@@ -120,8 +157,8 @@ def create_campaign():
     if request.method == 'POST':
         name = request.form['name']
         description = request.form['description']
-        keywords = request.form['keywords']
-        hashtags = request.form['hashtags']
+        keywords = [keyword.strip() for keyword in request.form['keywords'].split(',') if keyword.strip()]
+        hashtags = request.form['hashtags'].replace(',', ' ').split()
         target_audience = request.form['target_audience']
         tweet_frequency = int(request.form.get('tweet_frequency', 3))
         
@@ -154,12 +191,12 @@ def generate_content(campaign_id):
     
     try:
         # Get trending hashtags for context
-        trending_hashtags = twitter_service.get_trending_hashtags()
+        trending_hashtags, _ = twitter_service.get_cached_trending()
         
         # Generate AI content
         content = ai_service.generate_tweet_content(
-            keywords=campaign.keywords,
-            hashtags=campaign.hashtags,
+            keywords=', '.join(campaign.keywords or []),
+            hashtags=', '.join(campaign.hashtags or []),
             target_audience=campaign.target_audience,
             trending_hashtags=trending_hashtags
         )
@@ -176,31 +213,43 @@ def schedule_tweet():
     scheduled_time_str = request.form['scheduled_time']
     campaign_id = request.form.get('campaign_id')
     
+    # Cheap checks first, so bad input is rejected before any model or database call
+    if len(content) > 280:
+        flash('Tweet content exceeds 280 characters', 'error')
+        return redirect(request.referrer)
+    
+    spam_verdict = fast_spam_prefilter(content)
+    if spam_verdict:
+        flash('Content flagged as potential spam. Please revise.', 'warning')
+        return redirect(request.referrer)
+    
     try:
         scheduled_time = datetime.fromisoformat(scheduled_time_str)
-        
-        # Check content length
-        if len(content) > 280:
-            flash('Tweet content exceeds 280 characters', 'error')
-            return redirect(request.referrer)
-        
-        # Check for spam patterns
-        if ai_service.check_spam_content(content):
-            flash('Content flagged as potential spam. Please revise.', 'warning')
-            return redirect(request.referrer)
-        
+    except ValueError:
+        flash('Invalid schedule time', 'error')
+        return redirect(request.referrer)
+    
+    # Model-based spam check for ambiguous content, before the transaction is opened
+    if spam_verdict is None and ai_service.check_spam_with_model(content):
+        flash('Content flagged as potential spam. Please revise.', 'warning')
+        return redirect(request.referrer)
+    
+    try:
         scheduled_tweet = ScheduledTweet(
             content=content,
             scheduled_time=scheduled_time,
             user_id=current_user.id,
-            campaign_id=campaign_id if campaign_id else None
+            campaign_id=campaign_id if campaign_id else None,
+            task_id=uuid()
         )
         
         db.session.add(scheduled_tweet)
         db.session.commit()
         
         # Schedule the background task
-        schedule_tweet_task.apply_async(args=[scheduled_tweet.id], eta=scheduled_time)
+        schedule_tweet_task.apply_async(
+            args=[scheduled_tweet.id], eta=scheduled_time, task_id=scheduled_tweet.task_id
+        )
         
         flash('Tweet scheduled successfully!', 'success')
         return redirect(url_for('dashboard'))
@@ -215,7 +264,7 @@ def schedule_tweet():
 @login_required
 def analytics():
     # Get analytics data for the last 30 days
-    end_date = datetime.utcnow()
+    end_date = datetime.now(timezone.utc)
     start_date = end_date - timedelta(days=30)
     
     # Get tweet performance data
@@ -278,12 +327,29 @@ def twitter_callback():
 @login_required
 def api_trending_hashtags():
     try:
-        hashtags = twitter_service.get_trending_hashtags()
-        return jsonify({'success': True, 'hashtags': hashtags})
+        hashtags_json, etag, cache_hit = twitter_service.get_trending_payload()
+        if request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+        else:
+            # The hashtags are already serialized, wrap them without decoding
+            response = app.response_class(
+                b'{"success": true, "hashtags": ' + hashtags_json + b'}',
+                mimetype='application/json'
+            )
+        # Weak, so the validator survives compression
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 's-maxage=300, stale-while-revalidate=86400'
+        response.headers['X-Cache'] = 'HIT' if cache_hit else 'MISS'
+        return response
     except Exception as e:
         logging.error(f"Trending hashtags error: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/v1/meta/cache-stats')
+@login_required
+def api_cache_stats():
+    return jsonify(cache.stats())
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('404.html'), 404
@@ -1,34 +1,44 @@
 import os
-import json
+import re
+import orjson
+import string
+import hashlib
 import logging
+from functools import lru_cache
 from typing import List, Dict, Any, Optional
+import httpx
 from google import genai
 from google.genai import types
+from services import cache
 
-class AIService:
-    def __init__(self):
-        self.client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY", "default_key"))
-    
-    def generate_tweet_content(self, keywords: str = "", hashtags: str = "", 
-                             target_audience: str = "", trending_hashtags: Optional[List[str]] = None) -> str:
-        """Generate AI-powered tweet content based on campaign parameters"""
-        try:
-            # Prepare context
-            context_parts = []
-            if keywords:
-                context_parts.append(f"Keywords: {keywords}")
-            if hashtags:
-                context_parts.append(f"Campaign hashtags: {hashtags}")
-            if target_audience:
-                context_parts.append(f"Target audience: {target_audience}")
-            if trending_hashtags:
-                context_parts.append(f"Trending hashtags: {', '.join(trending_hashtags[:5])}")
-            
-            context = "\n".join(context_parts) if context_parts else "General social media content"
-            
-            prompt = f"""Create an engaging tweet (max 280 characters) based on the following context:
+# Spam and sentiment verdicts only depend on the content
+VERDICT_CACHE_TTL = 86400  # seconds
+
+# Known spam markers, compiled into one alternation so content is scanned in a single pass
+SPAM_PATTERNS = [
+    r'\b(?:bit\.ly|tinyurl\.com|goo\.gl|ow\.ly|is\.gd|buff\.ly|cutt\.ly|shorturl\.at)/',
+    r'!{3,}',
+    r'\${2,}',
+    r'\bfree money\b',
+    r'\bclick (?:here|the link)\b',
+    r'\bact now\b',
+    r'\blimited time offer\b',
+    r'\bmake money (?:fast|online)\b',
+    r'\bbuy (?:cheap )?followers\b',
+    r'\bfollow (?:for|4) follow\b',
+    r'\bf4f\b',
+    r'\bdm (?:me )?for (?:promo|collab)',
+    r'\b100% free\b',
+    r'\bwin an? (?:free )?(?:iphone|gift card)\b',
+]
+_SPAM_RE = re.compile('|'.join(SPAM_PATTERNS), re.IGNORECASE)
+
+# Content with at least this many spam signals is rejected without asking the model
+SPAM_SIGNAL_THRESHOLD = 2
+
+TWEET_PROMPT = string.Template("""Create an engaging tweet (max 280 characters) based on the following context:
             
-{context}
+$context
 
 Requirements:
 - Keep it under 280 characters
@@ -38,14 +48,78 @@ Requirements:
 - Make it suitable for social media engagement
 - Focus on value or entertainment for the audience
 
-Generate only the tweet content, no additional text or quotes."""
+Generate only the tweet content, no additional text or quotes.""")
 
-            response = self.client.models.generate_content(
+@lru_cache(maxsize=2048)
+def _build_tweet_prompt(keywords: str, hashtags: str, target_audience: str,
+                        trending_hashtags: tuple) -> str:
+    """Fill the tweet prompt; campaigns reuse the same parameters so the result is memoized"""
+    context = "\n".join(part for part in (
+        f"Keywords: {keywords}" if keywords else "",
+        f"Campaign hashtags: {hashtags}" if hashtags else "",
+        f"Target audience: {target_audience}" if target_audience else "",
+        f"Trending hashtags: {', '.join(trending_hashtags)}" if trending_hashtags else ""
+    ) if part)
+    return TWEET_PROMPT.substitute(context=context or "General social media content")
+
+def _content_digest(content: str) -> str:
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+def fast_spam_prefilter(content: str) -> Optional[bool]:
+    """Cheap spam check: True for obvious spam, False for clean content, None when ambiguous"""
+    signals = sum(1 for _ in _SPAM_RE.finditer(content))
+    
+    if content.count('#') > 5:
+        signals += 1
+    if content.count('@') > 5:
+        signals += 1
+    
+    letters = [c for c in content if c.isalpha()]
+    if len(letters) >= 20 and sum(c.isupper() for c in letters) / len(letters) > 0.7:
+        signals += 1
+    
+    if signals >= SPAM_SIGNAL_THRESHOLD:
+        return True
+    if signals == 0:
+        return False
+    return None
+
+class AIService:
+    def __init__(self):
+        # One pooled HTTP/2 connection set shared by every Gemini call
+        self.client = genai.Client(
+            api_key=os.environ.get("GEMINI_API_KEY", "default_key"),
+            http_options=types.HttpOptions(
+                timeout=30000,  # milliseconds
+                client_args={
+                    'http2': True,
+                    'limits': httpx.Limits(max_keepalive_connections=50)
+                }
+            )
+        )
+    
+    def generate_tweet_content(self, keywords: str = "", hashtags: str = "", 
+                             target_audience: str = "", trending_hashtags: Optional[List[str]] = None) -> str:
+        """Generate AI-powered tweet content based on campaign parameters"""
+        try:
+            prompt = _build_tweet_prompt(
+                keywords,
+                hashtags,
+                target_audience,
+                tuple(trending_hashtags[:5]) if trending_hashtags else ()
+            )
+            
+            # Stream the response and stop as soon as a full tweet has arrived
+            content = ""
+            for chunk in self.client.models.generate_content_stream(
                 model="gemini-2.5-flash",
                 contents=prompt
-            )
+            ):
+                content += chunk.text or ""
+                if len(content) >= 280:
+                    break
             
-            content = response.text.strip() if response.text else ""
+            content = content.strip()
             
             # Ensure content is within Twitter's character limit
             if len(content) > 280:
@@ -59,8 +133,32 @@ Generate only the tweet content, no additional text or quotes."""
     
     def check_spam_content(self, content: str) -> bool:
         """Check if content appears to be spam using AI analysis"""
+        # Only ambiguous content needs the model
+        verdict = fast_spam_prefilter(content)
+        if verdict is not None:
+            return verdict
+        
+        return self.check_spam_with_model(content)
+    
+    def check_spam_with_model(self, content: str) -> bool:
+        """Model-only spam check, for content fast_spam_prefilter found ambiguous"""
         try:
-            prompt = f"""Analyze the following tweet content for spam characteristics:
+            return self._spam_verdict(content)
+            
+        except Exception as e:
+            logging.error(f"Spam check error: {e}")
+            # Conservative approach: if we can't check, assume it's not spam
+            return False
+    
+    @lru_cache(maxsize=4096)
+    def _spam_verdict(self, content: str) -> bool:
+        """Spam verdict for content, cached in-process and in Redis by content hash"""
+        key = f"spam:{_content_digest(content)}"
+        result = cache.get_json(key)
+        if result is not None:
+            return result.get('is_spam', False)
+        
+        prompt = f"""Analyze the following tweet content for spam characteristics:
 
 Content: "{content}"
 
@@ -74,24 +172,21 @@ Check for:
 Respond with JSON format:
 {{"is_spam": boolean, "confidence": float, "reasons": ["reason1", "reason2"]}}"""
 
-            response = self.client.models.generate_content(
-                model="gemini-2.5-pro",
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json",
-                ),
-            )
-            
-            if response.text:
-                result = json.loads(response.text)
-                return result.get('is_spam', False)
-            
-            return False
-            
-        except Exception as e:
-            logging.error(f"Spam check error: {e}")
-            # Conservative approach: if we can't check, assume it's not spam
-            return False
+        response = self.client.models.generate_content(
+            model="gemini-2.5-pro",
+            contents=prompt,
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+            ),
+        )
+        
+        if response.text:
+            result = orjson.loads(response.text)
+            cache.set_json(key, result, VERDICT_CACHE_TTL)
+            return result.get('is_spam', False)
+        
+        # Raising keeps the empty answer out of both caches, check_spam_with_model applies the fallback
+        raise Exception("Empty spam check response")
     
     def generate_campaign_suggestions(self, industry: str = "", goals: str = "") -> List[Dict[str, Any]]:
         """Generate campaign suggestions based on industry and goals"""
@@ -131,7 +226,7 @@ Respond in JSON format:
             )
             
             if response.text:
-                result = json.loads(response.text)
+                result = orjson.loads(response.text)
                 return result.get('campaigns', [])
             
             return []
@@ -143,7 +238,22 @@ Respond in JSON format:
     def analyze_content_sentiment(self, content: str) -> Dict[str, Any]:
         """Analyze sentiment of tweet content"""
         try:
-            prompt = f"""Analyze the sentiment of this tweet content:
+            # Copy so callers can't mutate the cached verdict
+            return dict(self._sentiment_verdict(content))
+            
+        except Exception as e:
+            logging.error(f"Sentiment analysis error: {e}")
+            return {"sentiment": "neutral", "confidence": 0.5, "engagement_potential": "medium"}
+    
+    @lru_cache(maxsize=4096)
+    def _sentiment_verdict(self, content: str) -> Dict[str, Any]:
+        """Sentiment analysis for content, cached in-process and in Redis by content hash"""
+        key = f"sentiment:{_content_digest(content)}"
+        result = cache.get_json(key)
+        if result is not None:
+            return result
+        
+        prompt = f"""Analyze the sentiment of this tweet content:
 
 Content: "{content}"
 
@@ -162,19 +272,22 @@ Respond in JSON format:
   "summary": "Brief analysis summary"
 }}"""
 
-            response = self.client.models.generate_content(
-                model="gemini-2.5-pro",
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json",
-                ),
-            )
-            
-            if response.text:
-                return json.loads(response.text)
-            
-            return {"sentiment": "neutral", "confidence": 0.5, "engagement_potential": "medium"}
-            
-        except Exception as e:
-            logging.error(f"Sentiment analysis error: {e}")
-            return {"sentiment": "neutral", "confidence": 0.5, "engagement_potential": "medium"}
+        response = self.client.models.generate_content(
+            model="gemini-2.5-pro",
+            contents=prompt,
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+            ),
+        )
+        
+        if response.text:
+            result = orjson.loads(response.text)
+            cache.set_json(key, result, VERDICT_CACHE_TTL)
+            return result
+        
+        raise Exception("Empty sentiment analysis response")
+
+@lru_cache(maxsize=1)
+def get_ai_service() -> AIService:
+    """Shared AIService instance, so every caller reuses one Gemini connection pool"""
+    return AIService()
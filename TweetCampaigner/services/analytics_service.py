@@ -1,142 +1,260 @@
+import io
+import csv
 import logging
 from datetime import datetime, timedelta
-from typing import Dict, List, Any
-from sqlalchemy import func
+from typing import Dict, List, Any, Optional
+from sqlalchemy import func, text, and_, case, cast, select, bindparam, Float
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from app import db
-from models import TweetAnalytics, ScheduledTweet, Campaign
+from models import TweetAnalytics, ScheduledTweet, Campaign, CampaignStats
+from services import cache
+
+# Batches above this size are loaded with COPY on PostgreSQL
+COPY_THRESHOLD = 100
+
+ANALYTICS_COLUMNS = ('tweet_id', 'user_id', 'campaign_id', 'likes', 'retweets',
+                     'replies', 'impressions')
+
+CAMPAIGN_STATS_METRICS = ('likes', 'retweets', 'replies', 'total_engagement', 'impressions', 'tweet_count')
+
+# Dashboard reads are cached briefly and dropped whenever the user's data changes
+ANALYTICS_CACHE_TTL = 60  # seconds
+
+def _user_cache_tag(self, user_id: int, *args, **kwargs) -> str:
+    return f"analytics:{user_id}"
+
+def _upsert(model):
+    """INSERT that takes ON CONFLICT DO UPDATE, on PostgreSQL or SQLite"""
+    if db.engine.dialect.name == 'sqlite':
+        return sqlite_insert(model)
+    return pg_insert(model)
+
+def _next_day(day):
+    """The day after a DATE expression"""
+    if db.engine.dialect.name == 'sqlite':
+        return func.date(day, '+1 day')
+    return day + 1
+
+def _engagement_rate(interactions, impressions):
+    """Interactions as a percentage of impressions, 0 without impressions"""
+    return func.coalesce(cast(interactions, Float) * 100 / func.nullif(impressions, 0), 0)
+
+# Aggregation statements are built once and reused with bound parameters:
+#   user_id, start_day/end_day (dates, for campaign_stats) and start_date/end_date (datetimes)
+_USER_METRICS_STMT = select(
+    func.sum(CampaignStats.likes).label('total_likes'),
+    func.sum(CampaignStats.retweets).label('total_retweets'),
+    func.sum(CampaignStats.replies).label('total_replies'),
+    func.sum(CampaignStats.impressions).label('total_impressions'),
+    func.sum(CampaignStats.tweet_count).label('total_analyzed_tweets'),
+    _engagement_rate(
+        func.sum(CampaignStats.total_engagement), func.sum(CampaignStats.impressions)
+    ).label('engagement_rate')
+).where(
+    CampaignStats.user_id == bindparam('user_id'),
+    CampaignStats.day >= bindparam('start_day'),
+    CampaignStats.day <= bindparam('end_day')
+)
+
+# Counts per status, pivoted in Python; served from ix_tweet_user_created
+_USER_POSTING_STMT = select(
+    ScheduledTweet.status,
+    func.count().label('n')
+).where(
+    ScheduledTweet.user_id == bindparam('user_id'),
+    ScheduledTweet.created_at >= bindparam('start_date'),
+    ScheduledTweet.created_at <= bindparam('end_date')
+).group_by(
+    ScheduledTweet.status
+)
+
+# Campaigns without analytics still get a row
+_CAMPAIGN_METRICS_STMT = select(
+    Campaign.id,
+    Campaign.name,
+    Campaign.is_active,
+    func.sum(CampaignStats.likes).label('likes'),
+    func.sum(CampaignStats.retweets).label('retweets'),
+    func.sum(CampaignStats.replies).label('replies'),
+    func.sum(CampaignStats.impressions).label('impressions'),
+    func.sum(CampaignStats.tweet_count).label('tweet_count'),
+    _engagement_rate(
+        func.sum(CampaignStats.total_engagement), func.sum(CampaignStats.impressions)
+    ).label('engagement_rate')
+).outerjoin(
+    CampaignStats, and_(
+        CampaignStats.user_id == Campaign.user_id,
+        CampaignStats.campaign_id == Campaign.id,
+        CampaignStats.day >= bindparam('start_day'),
+        CampaignStats.day <= bindparam('end_day')
+    )
+).where(
+    Campaign.user_id == bindparam('user_id')
+).group_by(
+    Campaign.id, Campaign.name, Campaign.is_active
+).order_by(
+    Campaign.id
+)
+
+_CAMPAIGN_POSTING_STMT = select(
+    ScheduledTweet.campaign_id,
+    ScheduledTweet.status,
+    func.count().label('n')
+).where(
+    ScheduledTweet.user_id == bindparam('user_id'),
+    ScheduledTweet.campaign_id.isnot(None),
+    ScheduledTweet.created_at >= bindparam('start_date'),
+    ScheduledTweet.created_at <= bindparam('end_date')
+).group_by(
+    ScheduledTweet.campaign_id, ScheduledTweet.status
+)
+
+_SINGLE_CAMPAIGN_METRICS_STMT = _CAMPAIGN_METRICS_STMT.where(Campaign.id == bindparam('campaign_id'))
+_SINGLE_CAMPAIGN_POSTING_STMT = select(
+    ScheduledTweet.status,
+    func.count().label('n')
+).where(
+    ScheduledTweet.user_id == bindparam('user_id'),
+    ScheduledTweet.campaign_id == bindparam('campaign_id'),
+    ScheduledTweet.created_at >= bindparam('start_date'),
+    ScheduledTweet.created_at <= bindparam('end_date')
+).group_by(
+    ScheduledTweet.status
+)
+
+def _range_params(user_id: int, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
+    return {
+        'user_id': user_id,
+        'start_date': start_date,
+        'end_date': end_date,
+        'start_day': start_date.date(),
+        'end_day': end_date.date()
+    }
 
 class AnalyticsService:
+    @cache.cached(lambda self, user_id, start_date, end_date: f"ua:{user_id}:{start_date.date()}:{end_date.date()}",
+                  ttl=ANALYTICS_CACHE_TTL, tag=_user_cache_tag)
     def get_user_analytics(self, user_id: int, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
         """Get comprehensive analytics for a user within a date range"""
         try:
-            # Get tweet performance metrics
-            tweet_metrics = db.session.query(
-                func.sum(TweetAnalytics.likes).label('total_likes'),
-                func.sum(TweetAnalytics.retweets).label('total_retweets'),
-                func.sum(TweetAnalytics.replies).label('total_replies'),
-                func.sum(TweetAnalytics.impressions).label('total_impressions'),
-                func.avg(TweetAnalytics.engagement_rate).label('avg_engagement_rate'),
-                func.count(TweetAnalytics.id).label('total_analyzed_tweets')
-            ).filter(
-                TweetAnalytics.user_id == user_id,
-                TweetAnalytics.last_updated >= start_date,
-                TweetAnalytics.last_updated <= end_date
-            ).first()
+            params = _range_params(user_id, start_date, end_date)
             
-            # Get posting activity
-            posting_activity = db.session.query(
-                func.count(ScheduledTweet.id).label('total_tweets'),
-                func.sum(func.case([(ScheduledTweet.status == 'posted', 1)], else_=0)).label('posted_tweets'),
-                func.sum(func.case([(ScheduledTweet.status == 'failed', 1)], else_=0)).label('failed_tweets'),
-                func.sum(func.case([(ScheduledTweet.status == 'scheduled', 1)], else_=0)).label('scheduled_tweets')
-            ).filter(
-                ScheduledTweet.user_id == user_id,
-                ScheduledTweet.created_at >= start_date,
-                ScheduledTweet.created_at <= end_date
-            ).first()
+            # Get tweet performance metrics from the daily rollup, as a plain dict with NULL sums as 0
+            metrics = {
+                key: value or 0
+                for key, value in db.session.execute(_USER_METRICS_STMT, params).one()._mapping.items()
+            }
             
-            # Calculate engagement metrics
-            total_interactions = (tweet_metrics.total_likes or 0) + \
-                               (tweet_metrics.total_retweets or 0) + \
-                               (tweet_metrics.total_replies or 0)
+            # Get posting activity
+            status_counts = dict(db.session.execute(_USER_POSTING_STMT, params).tuples().all())
+            total_tweets = sum(status_counts.values())
+            posted_tweets = status_counts.get('posted', 0)
             
-            total_impressions = tweet_metrics.total_impressions or 0
-            overall_engagement_rate = (total_interactions / total_impressions * 100) if total_impressions > 0 else 0
+            engagement_rate = round(metrics['engagement_rate'], 2)
             
             # Get daily activity for charts
             daily_activity = self._get_daily_activity(user_id, start_date, end_date)
             
-            return {
-                'total_likes': tweet_metrics.total_likes or 0,
-                'total_retweets': tweet_metrics.total_retweets or 0,
-                'total_replies': tweet_metrics.total_replies or 0,
-                'total_impressions': total_impressions,
-                'overall_engagement_rate': round(overall_engagement_rate, 2),
-                'avg_engagement_rate': round(tweet_metrics.avg_engagement_rate or 0, 2),
-                'total_tweets': posting_activity.total_tweets or 0,
-                'posted_tweets': posting_activity.posted_tweets or 0,
-                'failed_tweets': posting_activity.failed_tweets or 0,
-                'scheduled_tweets': posting_activity.scheduled_tweets or 0,
-                'success_rate': round((posting_activity.posted_tweets or 0) / max(posting_activity.total_tweets or 1, 1) * 100, 2),
-                'daily_activity': daily_activity
+            analytics = {
+                'total_likes': metrics['total_likes'],
+                'total_retweets': metrics['total_retweets'],
+                'total_replies': metrics['total_replies'],
+                'total_impressions': metrics['total_impressions'],
+                'overall_engagement_rate': engagement_rate,
+                'avg_engagement_rate': engagement_rate,
+                'total_tweets': total_tweets,
+                'posted_tweets': posted_tweets,
+                'failed_tweets': status_counts.get('failed', 0),
+                'scheduled_tweets': status_counts.get('scheduled', 0),
+                'success_rate': round(posted_tweets / max(total_tweets, 1) * 100, 2),
+                'daily_activity': daily_activity or []
             }
             
+            # Serve the totals without the chart, but don't cache that partial result
+            return analytics if daily_activity is not None else cache.Uncached(analytics)
+            
         except Exception as e:
             logging.error(f"User analytics error: {e}")
-            return self._get_empty_analytics()
+            return cache.Uncached(self._get_empty_analytics())
     
+    @cache.cached(lambda self, user_id, start_date, end_date: f"ca:{user_id}:{start_date.date()}:{end_date.date()}",
+                  ttl=ANALYTICS_CACHE_TTL, tag=_user_cache_tag)
     def get_campaign_analytics(self, user_id: int, start_date: datetime, end_date: datetime) -> List[Dict[str, Any]]:
         """Get analytics for all user campaigns"""
         try:
-            campaigns = Campaign.query.filter_by(user_id=user_id).all()
-            campaign_analytics = []
-            
-            for campaign in campaigns:
-                # Get campaign tweet metrics
-                metrics = db.session.query(
-                    func.sum(TweetAnalytics.likes).label('likes'),
-                    func.sum(TweetAnalytics.retweets).label('retweets'),
-                    func.sum(TweetAnalytics.replies).label('replies'),
-                    func.sum(TweetAnalytics.impressions).label('impressions'),
-                    func.avg(TweetAnalytics.engagement_rate).label('avg_engagement'),
-                    func.count(TweetAnalytics.id).label('tweet_count')
-                ).filter(
-                    TweetAnalytics.campaign_id == campaign.id,
-                    TweetAnalytics.last_updated >= start_date,
-                    TweetAnalytics.last_updated <= end_date
-                ).first()
-                
-                # Get posting stats
-                posting_stats = db.session.query(
-                    func.count(ScheduledTweet.id).label('total_scheduled'),
-                    func.sum(func.case([(ScheduledTweet.status == 'posted', 1)], else_=0)).label('posted')
-                ).filter(
-                    ScheduledTweet.campaign_id == campaign.id,
-                    ScheduledTweet.created_at >= start_date,
-                    ScheduledTweet.created_at <= end_date
-                ).first()
-                
-                campaign_analytics.append({
-                    'id': campaign.id,
-                    'name': campaign.name,
-                    'is_active': campaign.is_active,
-                    'likes': metrics.likes or 0,
-                    'retweets': metrics.retweets or 0,
-                    'replies': metrics.replies or 0,
-                    'impressions': metrics.impressions or 0,
-                    'avg_engagement': round(metrics.avg_engagement or 0, 2),
-                    'tweet_count': metrics.tweet_count or 0,
-                    'total_scheduled': posting_stats.total_scheduled or 0,
-                    'posted': posting_stats.posted or 0,
-                    'success_rate': round((posting_stats.posted or 0) / max(posting_stats.total_scheduled or 1, 1) * 100, 2)
-                })
+            params = _range_params(user_id, start_date, end_date)
+            
+            # Tweet metrics per campaign from the daily rollup
+            campaign_metrics = db.session.execute(_CAMPAIGN_METRICS_STMT, params).all()
+            
+            # Posting stats for all of the user's campaigns at once
+            posting_stats = {}
+            for row in db.session.execute(_CAMPAIGN_POSTING_STMT, params):
+                posting_stats.setdefault(row.campaign_id, {})[row.status] = row.n
+            
+            campaign_analytics = [
+                self._campaign_analytics_row(metrics, posting_stats.get(metrics.id, {}))
+                for metrics in campaign_metrics
+            ]
             
             return campaign_analytics
             
         except Exception as e:
             logging.error(f"Campaign analytics error: {e}")
-            return []
+            return cache.Uncached([])
     
-    def _get_daily_activity(self, user_id: int, start_date: datetime, end_date: datetime) -> List[Dict[str, Any]]:
-        """Get daily posting activity for charts"""
+    @cache.cached(lambda self, user_id, campaign_id, start_date, end_date:
+                  f"ca:{user_id}:{campaign_id}:{start_date.date()}:{end_date.date()}",
+                  ttl=ANALYTICS_CACHE_TTL, tag=_user_cache_tag)
+    def get_single_campaign_analytics(self, user_id: int, campaign_id: int,
+                                      start_date: datetime, end_date: datetime) -> Dict[str, Any]:
+        """Get analytics for one campaign, empty if the user has no such campaign"""
         try:
-            daily_data = db.session.query(
-                func.date(ScheduledTweet.posted_at).label('date'),
-                func.count(ScheduledTweet.id).label('posts'),
-                func.sum(TweetAnalytics.likes).label('likes'),
-                func.sum(TweetAnalytics.retweets).label('retweets')
-            ).outerjoin(
-                TweetAnalytics, ScheduledTweet.tweet_id == TweetAnalytics.tweet_id
-            ).filter(
-                ScheduledTweet.user_id == user_id,
-                ScheduledTweet.status == 'posted',
-                ScheduledTweet.posted_at >= start_date,
-                ScheduledTweet.posted_at <= end_date
-            ).group_by(
-                func.date(ScheduledTweet.posted_at)
-            ).order_by(
-                func.date(ScheduledTweet.posted_at)
-            ).all()
+            params = dict(_range_params(user_id, start_date, end_date), campaign_id=campaign_id)
+            
+            metrics = db.session.execute(_SINGLE_CAMPAIGN_METRICS_STMT, params).first()
+            if not metrics:
+                return {}
+            
+            status_counts = {row.status: row.n for row in db.session.execute(_SINGLE_CAMPAIGN_POSTING_STMT, params)}
+            return self._campaign_analytics_row(metrics, status_counts)
+            
+        except Exception as e:
+            logging.error(f"Campaign analytics error: {e}")
+            return cache.Uncached({})
+    
+    def _campaign_analytics_row(self, metrics, status_counts: Dict[str, int]) -> Dict[str, Any]:
+        """Combine a campaign metrics row with its tweet counts by status"""
+        total_scheduled = sum(status_counts.values())
+        posted = status_counts.get('posted', 0)
+        
+        return {
+            'id': metrics.id,
+            'name': metrics.name,
+            'is_active': metrics.is_active,
+            'likes': metrics.likes or 0,
+            'retweets': metrics.retweets or 0,
+            'replies': metrics.replies or 0,
+            'impressions': metrics.impressions or 0,
+            'avg_engagement': round(metrics.engagement_rate or 0, 2),
+            'tweet_count': metrics.tweet_count or 0,
+            'total_scheduled': total_scheduled,
+            'posted': posted,
+            'success_rate': round(posted / max(total_scheduled, 1) * 100, 2)
+        }
+    
+    def _get_daily_activity(self, user_id: int, start_date: datetime, end_date: datetime) -> Optional[List[Dict[str, Any]]]:
+        """Get daily posting activity for charts, None if it could not be read"""
+        try:
+            daily_data = db.session.execute(text(
+                "SELECT d AS date, posts, likes, retweets FROM mv_user_daily_analytics "
+                "WHERE user_id = :user_id AND d BETWEEN :start_date AND :end_date ORDER BY d"
+            ), {
+                'user_id': user_id,
+                'start_date': start_date.date(),
+                'end_date': end_date.date()
+            }).all()
             
             return [
                 {
@@ -150,52 +268,169 @@ class AnalyticsService:
             
         except Exception as e:
             logging.error(f"Daily activity error: {e}")
-            return []
+            return None
     
     def update_tweet_analytics(self, tweet_id: str, analytics_data: Dict[str, Any], user_id: int, campaign_id: int = None):
         """Update or create tweet analytics record"""
         try:
-            # Check if analytics record exists
-            existing_analytics = TweetAnalytics.query.filter_by(
-                tweet_id=tweet_id,
-                user_id=user_id
-            ).first()
-            
-            # Calculate engagement rate
-            total_engagement = analytics_data.get('likes', 0) + \
-                             analytics_data.get('retweets', 0) + \
-                             analytics_data.get('replies', 0)
-            impressions = analytics_data.get('impressions', 0)
-            engagement_rate = (total_engagement / impressions * 100) if impressions > 0 else 0
-            
-            if existing_analytics:
-                # Update existing record
-                existing_analytics.likes = analytics_data.get('likes', 0)
-                existing_analytics.retweets = analytics_data.get('retweets', 0)
-                existing_analytics.replies = analytics_data.get('replies', 0)
-                existing_analytics.impressions = impressions
-                existing_analytics.engagement_rate = engagement_rate
-                existing_analytics.last_updated = datetime.utcnow()
-            else:
-                # Create new record
-                new_analytics = TweetAnalytics(
-                    tweet_id=tweet_id,
-                    likes=analytics_data.get('likes', 0),
-                    retweets=analytics_data.get('retweets', 0),
-                    replies=analytics_data.get('replies', 0),
-                    impressions=impressions,
-                    engagement_rate=engagement_rate,
-                    user_id=user_id,
-                    campaign_id=campaign_id
-                )
-                db.session.add(new_analytics)
-            
+            self._upsert_analytics([dict(analytics_data, tweet_id=tweet_id, user_id=user_id, campaign_id=campaign_id)])
             db.session.commit()
+            self.invalidate_user_cache(user_id)
             
         except Exception as e:
             db.session.rollback()
             logging.error(f"Analytics update error: {e}")
     
+    def bulk_upsert_analytics(self, rows: List[Dict[str, Any]]):
+        """Write analytics for many tweets at once.
+
+        Each row holds tweet_id, user_id, campaign_id and the metrics returned
+        by TwitterService.get_tweet_analytics. Large batches are loaded with COPY
+        on PostgreSQL; everything else is one multi-row upsert, which needs
+        PostgreSQL or SQLite.
+        """
+        if not rows:
+            return
+        
+        try:
+            if len(rows) <= COPY_THRESHOLD or db.engine.dialect.name != 'postgresql':
+                self._upsert_analytics(rows)
+            else:
+                self._copy_upsert_analytics(rows)
+            db.session.commit()
+            for user_id in {row['user_id'] for row in rows}:
+                self.invalidate_user_cache(user_id)
+            
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Bulk analytics update error: {e}")
+    
+    def _upsert_analytics(self, rows: List[Dict[str, Any]]):
+        """Insert or update rows in one multi-row statement, keyed by the (tweet_id, user_id) constraint"""
+        # ON CONFLICT cannot touch the same row twice, keep the last sample per tweet
+        records = {}
+        for row in rows:
+            records[(row['tweet_id'], row['user_id'])] = {
+                'tweet_id': row['tweet_id'],
+                'user_id': row['user_id'],
+                'campaign_id': row.get('campaign_id'),
+                'likes': row.get('likes', 0),
+                'retweets': row.get('retweets', 0),
+                'replies': row.get('replies', 0),
+                'impressions': row.get('impressions', 0)
+            }
+        
+        stmt = _upsert(TweetAnalytics).values(list(records.values()))
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=('tweet_id', 'user_id'),
+            set_={
+                'likes': stmt.excluded.likes,
+                'retweets': stmt.excluded.retweets,
+                'replies': stmt.excluded.replies,
+                'impressions': stmt.excluded.impressions,
+                'last_updated': func.now()
+            }
+        ))
+        
+        self._refresh_campaign_stats([tweet_id for tweet_id, _ in records])
+    
+    def _copy_upsert_analytics(self, rows: List[Dict[str, Any]]):
+        """COPY rows into a temp table and merge them into tweet_analytics in one statement"""
+        # ON CONFLICT cannot touch the same row twice, keep the last sample per tweet
+        records = {}
+        for row in rows:
+            records[(row['tweet_id'], row['user_id'])] = (
+                row['tweet_id'],
+                row['user_id'],
+                row.get('campaign_id'),
+                row.get('likes', 0),
+                row.get('retweets', 0),
+                row.get('replies', 0),
+                row.get('impressions', 0)
+            )
+        
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerows(records.values())
+        buffer.seek(0)
+        
+        columns = ', '.join(ANALYTICS_COLUMNS)
+        db.session.execute(text(
+            "CREATE TEMP TABLE tweet_analytics_tmp ("
+            "tweet_id varchar(100), user_id integer, campaign_id integer, likes integer, "
+            "retweets integer, replies integer, impressions integer"
+            ") ON COMMIT DROP"
+        ))
+        
+        cursor = db.session.connection().connection.cursor()
+        cursor.copy_expert(f"COPY tweet_analytics_tmp ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+        
+        updates = ', '.join(f"{column} = EXCLUDED.{column}" for column in ANALYTICS_COLUMNS[3:])
+        db.session.execute(text(
+            f"INSERT INTO {TweetAnalytics.__tablename__} ({columns}, last_updated) "
+            f"SELECT {columns}, now() FROM tweet_analytics_tmp "
+            f"ON CONFLICT (tweet_id, user_id) DO UPDATE SET {updates}, last_updated = EXCLUDED.last_updated"
+        ))
+        
+        self._refresh_campaign_stats([tweet_id for tweet_id, _ in records])
+    
+    def _refresh_campaign_stats(self, tweet_ids: List[str]):
+        """Recompute the campaign_stats rows for every user and posting day the given tweets fall in.
+
+        Rows are rebuilt from tweet_analytics rather than incremented, so
+        replayed or concurrent analytics writes cannot make them drift.
+        """
+        touched = select(
+            ScheduledTweet.user_id,
+            func.date(ScheduledTweet.posted_at).label('day')
+        ).where(
+            ScheduledTweet.tweet_id.in_(tweet_ids),
+            ScheduledTweet.posted_at.isnot(None)
+        ).distinct().cte('touched')
+        
+        campaign_id = func.coalesce(TweetAnalytics.campaign_id, 0)
+        day = func.date(ScheduledTweet.posted_at)
+        totals = select(
+            TweetAnalytics.user_id,
+            campaign_id,
+            day,
+            func.sum(TweetAnalytics.likes),
+            func.sum(TweetAnalytics.retweets),
+            func.sum(TweetAnalytics.replies),
+            func.sum(TweetAnalytics.total_engagement),
+            func.sum(TweetAnalytics.impressions),
+            func.count(TweetAnalytics.id)
+        ).join(
+            ScheduledTweet, and_(
+                ScheduledTweet.tweet_id == TweetAnalytics.tweet_id,
+                ScheduledTweet.user_id == TweetAnalytics.user_id
+            )
+        ).join(
+            touched, and_(
+                touched.c.user_id == ScheduledTweet.user_id,
+                ScheduledTweet.posted_at >= touched.c.day,
+                ScheduledTweet.posted_at < _next_day(touched.c.day)
+            )
+        ).group_by(
+            TweetAnalytics.user_id, campaign_id, day
+        )
+        
+        stmt = _upsert(CampaignStats).from_select(
+            ('user_id', 'campaign_id', 'day') + CAMPAIGN_STATS_METRICS, totals
+        )
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=('user_id', 'campaign_id', 'day'),
+            set_={column: stmt.excluded[column] for column in CAMPAIGN_STATS_METRICS}
+        ))
+    
+    def invalidate_user_cache(self, user_id: int):
+        """Drop the user's cached analytics after their tweets or campaigns change"""
+        cache.invalidate_tag(f"analytics:{user_id}")
+    
+    def refresh_daily_activity(self):
+        """Rebuild the daily activity view without blocking dashboard reads"""
+        db.session.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_user_daily_analytics"))
+        db.session.commit()
+    
     def _get_empty_analytics(self) -> Dict[str, Any]:
         """Return empty analytics structure"""
         return {
@@ -213,13 +448,30 @@ class AnalyticsService:
             'daily_activity': []
         }
     
+    @cache.cached(lambda self, user_id, limit=5: f"tt:{user_id}:{limit}", ttl=ANALYTICS_CACHE_TTL, tag=_user_cache_tag)
     def get_top_performing_tweets(self, user_id: int, limit: int = 5) -> List[Dict[str, Any]]:
         """Get top performing tweets by engagement"""
         try:
+            # Truncate in the database so long tweets aren't sent over in full
+            content_preview = case(
+                (func.length(ScheduledTweet.content) > 100, func.substr(ScheduledTweet.content, 1, 100) + '...'),
+                else_=ScheduledTweet.content
+            )
+            
             top_tweets = db.session.query(
-                TweetAnalytics, ScheduledTweet.content
+                content_preview.label('content'),
+                TweetAnalytics.likes,
+                TweetAnalytics.retweets,
+                TweetAnalytics.replies,
+                TweetAnalytics.engagement_rate,
+                TweetAnalytics.impressions
+            ).select_from(
+                TweetAnalytics
             ).join(
-                ScheduledTweet, TweetAnalytics.tweet_id == ScheduledTweet.tweet_id
+                ScheduledTweet, and_(
+                    ScheduledTweet.tweet_id == TweetAnalytics.tweet_id,
+                    ScheduledTweet.user_id == TweetAnalytics.user_id
+                )
             ).filter(
                 TweetAnalytics.user_id == user_id
             ).order_by(
@@ -228,16 +480,16 @@ class AnalyticsService:
             
             return [
                 {
-                    'content': tweet.content[:100] + '...' if len(tweet.content) > 100 else tweet.content,
-                    'likes': analytics.likes,
-                    'retweets': analytics.retweets,
-                    'replies': analytics.replies,
-                    'engagement_rate': round(analytics.engagement_rate, 2),
-                    'impressions': analytics.impressions
+                    'content': tweet.content,
+                    'likes': tweet.likes,
+                    'retweets': tweet.retweets,
+                    'replies': tweet.replies,
+                    'engagement_rate': round(tweet.engagement_rate, 2),
+                    'impressions': tweet.impressions
                 }
-                for analytics, tweet in top_tweets
+                for tweet in top_tweets
             ]
             
         except Exception as e:
             logging.error(f"Top tweets error: {e}")
-            return []
+            return cache.Uncached([])
@@ -0,0 +1,132 @@
+import os
+import orjson
+import logging
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+import redis
+
+# Shares the Redis instance used as the Celery broker
+redis_client = redis.Redis.from_url(
+    os.environ.get('REDIS_URL', 'redis://localhost:6379/0'),
+    socket_connect_timeout=1,
+    socket_timeout=1
+)
+
+def get_json(key: str) -> Optional[Any]:
+    """Get a JSON value from the cache, None on miss or cache error"""
+    try:
+        raw = redis_client.get(key)
+        return orjson.loads(raw) if raw is not None else None
+    except redis.RedisError as e:
+        logging.error(f"Cache read error for {key}: {e}")
+        return None
+
+def set_json(key: str, value: Any, ttl: int):
+    """Store a JSON value in the cache with a TTL in seconds"""
+    try:
+        redis_client.setex(key, ttl, orjson.dumps(value))
+    except (redis.RedisError, TypeError) as e:
+        logging.error(f"Cache write error for {key}: {e}")
+
+def delete(*keys: str):
+    """Remove keys from the cache"""
+    try:
+        redis_client.delete(*keys)
+    except redis.RedisError as e:
+        logging.error(f"Cache delete error for {keys}: {e}")
+
+def invalidate_tag(tag: str):
+    """Remove every key stored with cached(..., tag=...) under this tag"""
+    tag_key = f"tag:{tag}"
+    try:
+        keys = redis_client.smembers(tag_key)
+        redis_client.delete(tag_key, *keys)
+    except redis.RedisError as e:
+        logging.error(f"Cache delete error for tag {tag}: {e}")
+
+class Uncached:
+    """Wraps a cached() function's result that must not be stored, such as an error fallback"""
+    __slots__ = ('value',)
+    
+    def __init__(self, value: Any):
+        self.value = value
+
+def cached(key: Callable[..., str], ttl: int, tag: Optional[Callable[..., str]] = None):
+    """Cache-aside decorator: serve the JSON value stored under key(*args), else compute and store it.
+
+    Keys are grouped under tag(*args) so invalidate_tag can drop them without scanning,
+    and results returned as Uncached(value) are passed through without being stored.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            cache_key = key(*args, **kwargs)
+            try:
+                # Reads are counted in the same round trip, misses alongside the write
+                with redis_client.pipeline(transaction=False) as pipe:
+                    raw, _ = pipe.get(cache_key).incr('cache:stats:reads').execute()
+                if raw is not None:
+                    return orjson.loads(raw)
+            except redis.RedisError as e:
+                logging.error(f"Cache read error for {cache_key}: {e}")
+            
+            value = func(*args, **kwargs)
+            store = not isinstance(value, Uncached)
+            if not store:
+                value = value.value
+            
+            try:
+                with redis_client.pipeline(transaction=False) as pipe:
+                    pipe.incr('cache:stats:misses')
+                    if store:
+                        pipe.setex(cache_key, ttl, orjson.dumps(value))
+                        if tag:
+                            tag_key = f"tag:{tag(*args, **kwargs)}"
+                            pipe.sadd(tag_key, cache_key)
+                            pipe.expire(tag_key, ttl)
+                    pipe.execute()
+            except (redis.RedisError, TypeError) as e:
+                logging.error(f"Cache write error for {cache_key}: {e}")
+            return value
+        return wrapper
+    return decorator
+
+def stats() -> Dict[str, int]:
+    """Hit and miss counts for the cached() reads, shared across processes"""
+    try:
+        reads, misses = redis_client.mget('cache:stats:reads', 'cache:stats:misses')
+    except redis.RedisError as e:
+        logging.error(f"Cache stats error: {e}")
+        reads = misses = None
+    reads, misses = int(reads or 0), int(misses or 0)
+    return {'hits': max(reads - misses, 0), 'misses': misses}
+
+def hit_rate_limit(key: str, limit: int, window: int) -> bool:
+    """Count a hit against key and report whether more than limit hits landed within window seconds"""
+    try:
+        hits = redis_client.incr(key)
+        if hits == 1:
+            redis_client.expire(key, window)
+        return hits > limit
+    except redis.RedisError as e:
+        logging.error(f"Rate limit check error for {key}: {e}")
+        return False
+
+def get_fields(key: str) -> Optional[Dict[bytes, bytes]]:
+    """Get all fields of a cached hash, None on miss or cache error"""
+    try:
+        return redis_client.hgetall(key) or None
+    except redis.RedisError as e:
+        logging.error(f"Cache read error for {key}: {e}")
+        return None
+
+def set_fields(key: str, fields: Dict[str, Any], ttl: int):
+    """Store several values together under one key with a TTL in seconds"""
+    try:
+        with redis_client.pipeline() as pipe:
+            pipe.delete(key)
+            pipe.hset(key, mapping=fields)
+            pipe.expire(key, ttl)
+            pipe.execute()
+    except redis.RedisError as e:
+        logging.error(f"Cache write error for {key}: {e}")
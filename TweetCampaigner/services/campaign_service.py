@@ -1,14 +1,30 @@
 import json
+import orjson
 import logging
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Any
+from sqlalchemy import func, update, cast, String
 from app import db
 from models import Campaign, ScheduledTweet, TweetTemplate
-from services.ai_service import AIService
+from services.ai_service import get_ai_service
+from services.schedule_service import ScheduleService
+from services.analytics_service import AnalyticsService
+from services import cache
+from tasks import refresh_campaign_insights
+
+# Upper bound on concurrent Gemini calls when generating a batch of tweets
+CONTENT_GENERATION_WORKERS = 16
+
+# Campaign insights are regenerated in the background once the cached copy expires
+INSIGHTS_CACHE_TTL = 21600  # seconds
+INSIGHTS_REFRESH_DEBOUNCE = 300  # seconds
 
 class CampaignService:
     def __init__(self):
-        self.ai_service = AIService()
+        self.ai_service = get_ai_service()
+        self.schedule_service = ScheduleService()
+        self.analytics_service = AnalyticsService()
     
     def create_campaign_from_template(self, user_id: int, template_data: Dict[str, Any]) -> Campaign:
         """Create a campaign from AI-generated template"""
@@ -16,8 +32,8 @@ class CampaignService:
             campaign = Campaign(
                 name=template_data.get('name', 'New Campaign'),
                 description=template_data.get('description', ''),
-                keywords=json.dumps(template_data.get('keywords', [])),
-                hashtags=json.dumps(template_data.get('hashtags', [])),
+                keywords=template_data.get('keywords', []),
+                hashtags=template_data.get('hashtags', []),
                 target_audience=template_data.get('target_audience', ''),
                 tweet_frequency=template_data.get('tweet_frequency', 3),
                 user_id=user_id
@@ -35,25 +51,36 @@ class CampaignService:
     
     def generate_campaign_content(self, campaign_id: int, num_tweets: int = 5) -> List[str]:
         """Generate multiple tweet contents for a campaign"""
+        if num_tweets <= 0:
+            return []
+        
         try:
             campaign = Campaign.query.get(campaign_id)
             if not campaign:
                 raise Exception("Campaign not found")
             
-            # Parse campaign data
-            keywords = json.loads(campaign.keywords) if campaign.keywords else []
-            hashtags = json.loads(campaign.hashtags) if campaign.hashtags else []
+            keywords = campaign.keywords or []
+            hashtags = campaign.hashtags or []
+            
+            # Read everything the workers need up front, they must not touch the session
+            params = {
+                'keywords': ', '.join(keywords),
+                'hashtags': ', '.join(hashtags),
+                'target_audience': campaign.target_audience
+            }
+            
+            # Generate multiple variations, the Gemini calls run concurrently
+            with ThreadPoolExecutor(max_workers=min(num_tweets, CONTENT_GENERATION_WORKERS)) as executor:
+                results = list(executor.map(
+                    lambda _: self.ai_service.generate_tweet_content(**params),
+                    range(num_tweets)
+                ))
             
-            # Generate multiple variations
             generated_tweets = []
-            for i in range(num_tweets):
-                content = self.ai_service.generate_tweet_content(
-                    keywords=', '.join(keywords),
-                    hashtags=', '.join(hashtags),
-                    target_audience=campaign.target_audience
-                )
-                
-                if content and content not in generated_tweets:
+            seen = set()
+            for content in results:
+                if content and content not in seen:
+                    seen.add(content)
                     generated_tweets.append(content)
             
             return generated_tweets
@@ -71,6 +98,11 @@ class CampaignService:
                 raise Exception("Campaign not found")
             
             frequency = tweets_per_day or campaign.tweet_frequency
+            
+            # Nothing to schedule, don't pay for content generation
+            if end_date < start_date or (frequency or 0) <= 0:
+                return 0
+            
             total_days = (end_date - start_date).days + 1
             total_tweets_needed = total_days * frequency
             
@@ -80,37 +112,36 @@ class CampaignService:
             if not tweet_contents:
                 raise Exception("Failed to generate tweet content")
             
+            # Posting hours are the same every day (spread throughout the day)
+            hour_offsets = [(i + 1) * (24 // (frequency + 1)) for i in range(frequency)]
+            
             # Schedule tweets evenly across the date range
-            scheduled_count = 0
+            rows = []
             current_date = start_date
             content_index = 0
             
             while current_date <= end_date and content_index < len(tweet_contents):
                 # Schedule tweets for this day
-                for i in range(frequency):
+                for hour_offset in hour_offsets:
                     if content_index >= len(tweet_contents):
                         break
                     
-                    # Calculate posting time (spread throughout the day)
-                    hour_offset = (i + 1) * (24 // (frequency + 1))
                     posting_time = current_date.replace(hour=hour_offset, minute=0, second=0)
                     
-                    # Create scheduled tweet
-                    scheduled_tweet = ScheduledTweet(
-                        content=tweet_contents[content_index],
-                        scheduled_time=posting_time,
-                        user_id=campaign.user_id,
-                        campaign_id=campaign_id
-                    )
-                    
-                    db.session.add(scheduled_tweet)
-                    scheduled_count += 1
+                    rows.append({
+                        'content': tweet_contents[content_index],
+                        'scheduled_time': posting_time,
+                        'status': 'scheduled',
+                        'user_id': campaign.user_id,
+                        'campaign_id': campaign_id
+                    })
                     content_index += 1
                 
                 current_date += timedelta(days=1)
             
-            db.session.commit()
-            return scheduled_count
+            self.schedule_service.bulk_schedule(rows)
+            self.analytics_service.invalidate_user_cache(campaign.user_id)
+            return len(rows)
             
         except Exception as e:
             db.session.rollback()
@@ -124,33 +155,37 @@ class CampaignService:
             if not campaign:
                 raise Exception("Campaign not found")
             
-            # Get campaign tweets and their analytics
-            campaign_tweets = ScheduledTweet.query.filter_by(campaign_id=campaign_id).all()
+            # Count campaign tweets by status
+            status_counts = dict(
+                db.session.query(
+                    ScheduledTweet.status, func.count()
+                ).filter(
+                    ScheduledTweet.campaign_id == campaign_id
+                ).group_by(
+                    ScheduledTweet.status
+                ).all()
+            )
             
             # Calculate performance metrics
-            total_tweets = len(campaign_tweets)
-            posted_tweets = len([t for t in campaign_tweets if t.status == 'posted'])
-            failed_tweets = len([t for t in campaign_tweets if t.status == 'failed'])
+            total_tweets = sum(status_counts.values())
+            posted_tweets = status_counts.get('posted', 0)
+            failed_tweets = status_counts.get('failed', 0)
             
             # Get engagement metrics from analytics
-            from services.analytics_service import AnalyticsService
-            analytics_service = AnalyticsService()
-            
-            end_date = datetime.utcnow()
+            end_date = datetime.now(timezone.utc)
             start_date = campaign.created_at
             
-            campaign_analytics = analytics_service.get_campaign_analytics(
-                campaign.user_id, start_date, end_date
-            )
-            
-            # Find analytics for this specific campaign
-            current_campaign_analytics = next(
-                (ca for ca in campaign_analytics if ca['id'] == campaign_id),
-                {}
+            current_campaign_analytics = self.analytics_service.get_single_campaign_analytics(
+                campaign.user_id, campaign_id, start_date, end_date
             )
             
-            # Generate AI insights
-            insights = self._generate_campaign_insights(campaign, current_campaign_analytics)
+            # AI insights are generated in the background, serve whatever is cached
+            insights = cache.get_json(f"ci:{campaign_id}")
+            if insights is None:
+                insights = []
+                # Only the first miss in a while queues a refresh
+                if not cache.hit_rate_limit(f"ci:pending:{campaign_id}", 1, INSIGHTS_REFRESH_DEBOUNCE):
+                    refresh_campaign_insights.delay(campaign_id)
             
             return {
                 'campaign_name': campaign.name,
@@ -171,6 +206,19 @@ class CampaignService:
             logging.error(f"Campaign analysis error: {e}")
             return {}
     
+    def refresh_campaign_insights(self, campaign_id: int) -> List[str]:
+        """Generate AI insights for a campaign and cache them for analyze_campaign_performance"""
+        campaign = Campaign.query.get(campaign_id)
+        if not campaign:
+            return []
+        
+        analytics = self.analytics_service.get_single_campaign_analytics(
+            campaign.user_id, campaign_id, campaign.created_at, datetime.now(timezone.utc)
+        )
+        insights = self._generate_campaign_insights(campaign, analytics)
+        cache.set_json(f"ci:{campaign_id}", insights, INSIGHTS_CACHE_TTL)
+        return insights
+    
     def _generate_campaign_insights(self, campaign: Campaign, analytics: Dict[str, Any]) -> List[str]:
         """Generate AI-powered insights for campaign performance"""
         try:
@@ -203,13 +251,13 @@ Return insights as a JSON array of strings:
 {{"insights": ["insight1", "insight2", "insight3"]}}"""
 
             response = self.ai_service.client.models.generate_content(
-                model="gemini-2.5-pro",
+                model="gemini-2.5-flash",
                 contents=prompt,
                 config={"response_mime_type": "application/json"}
             )
             
             if response.text:
-                result = json.loads(response.text)
+                result = orjson.loads(response.text)
                 return result.get('insights', [])
             
             return []
@@ -262,15 +310,20 @@ Return insights as a JSON array of strings:
             campaign.is_active = False
             
             # Cancel scheduled tweets
-            scheduled_tweets = ScheduledTweet.query.filter_by(
-                campaign_id=campaign_id,
-                status='scheduled'
-            ).all()
-            
-            for tweet in scheduled_tweets:
-                tweet.status = 'cancelled'
+            task_ids = db.session.execute(
+                update(ScheduledTweet).where(
+                    ScheduledTweet.campaign_id == campaign_id,
+                    ScheduledTweet.status == 'scheduled'
+                ).values(status='cancelled').returning(
+                    ScheduledTweet.task_id
+                ).execution_options(synchronize_session=False)
+            ).scalars().all()
             
             db.session.commit()
+            
+            # Drop their queued posting tasks
+            self.schedule_service.revoke([task_id for task_id in task_ids if task_id])
+            self.analytics_service.invalidate_user_cache(campaign.user_id)
             return True
             
         except Exception as e:
@@ -287,17 +340,25 @@ Return insights as a JSON array of strings:
             
             campaign.is_active = True
             
-            # Reactivate future scheduled tweets
-            future_tweets = ScheduledTweet.query.filter(
-                ScheduledTweet.campaign_id == campaign_id,
-                ScheduledTweet.status == 'cancelled',
-                ScheduledTweet.scheduled_time > datetime.utcnow()
+            # Reactivate future scheduled tweets, their old tasks were revoked so each gets a new one
+            tweets = db.session.execute(
+                update(ScheduledTweet).where(
+                    ScheduledTweet.campaign_id == campaign_id,
+                    ScheduledTweet.status == 'cancelled',
+                    ScheduledTweet.scheduled_time > datetime.utcnow()
+                ).values(
+                    status='scheduled',
+                    task_id=cast(func.gen_random_uuid(), String)
+                ).returning(
+                    ScheduledTweet.id, ScheduledTweet.scheduled_time, ScheduledTweet.task_id
+                ).execution_options(synchronize_session=False)
             ).all()
             
-            for tweet in future_tweets:
-                tweet.status = 'scheduled'
-            
+            if tweets:
+                self.schedule_service.dispatch(tweets)
             db.session.commit()
+            
+            self.analytics_service.invalidate_user_cache(campaign.user_id)
             return True
             
         except Exception as e:
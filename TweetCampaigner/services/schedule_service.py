@@ -0,0 +1,60 @@
+import logging
+from datetime import datetime
+from typing import List, Dict, Any, Iterable, Tuple
+from celery import group
+from celery.utils import uuid
+from sqlalchemy import insert
+from app import db
+from models import ScheduledTweet
+from tasks import celery_app, schedule_tweet_task, _enqueue_after_commit
+
+class ScheduleService:
+    def bulk_schedule(self, rows: List[Dict[str, Any]]) -> List[int]:
+        """Insert many scheduled tweets in one statement and queue their posting tasks on commit"""
+        if not rows:
+            return []
+        
+        # Task ids are assigned up front so they are stored with the rows
+        rows = [dict(row, task_id=uuid()) for row in rows]
+        
+        try:
+            result = db.session.execute(
+                insert(ScheduledTweet).returning(ScheduledTweet.id, sort_by_parameter_order=True),
+                rows
+            )
+            tweet_ids = list(result.scalars())
+            
+            self.dispatch(
+                (tweet_id, row['scheduled_time'], row['task_id'])
+                for tweet_id, row in zip(tweet_ids, rows)
+            )
+            db.session.commit()
+            
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Bulk scheduling error: {e}")
+            raise Exception("Failed to schedule tweets")
+        
+        logging.info(f"Bulk scheduled {len(tweet_ids)} tweets")
+        return tweet_ids
+    
+    def dispatch(self, tweets: Iterable[Tuple[int, datetime, str]]):
+        """Queue posting tasks for (tweet id, scheduled time, task id) triples, each due at its ETA.
+        
+        The tasks are sent as one group once the current transaction commits, so a rollback
+        never leaves queued tasks behind and a broker error never undoes committed rows.
+        """
+        _enqueue_after_commit(group(
+            schedule_tweet_task.s(tweet_id).set(eta=scheduled_time, task_id=task_id)
+            for tweet_id, scheduled_time, task_id in tweets
+        ))
+    
+    def revoke(self, task_ids: List[str]):
+        """Discard queued posting tasks, the task's own status check still guards a missed revoke"""
+        if not task_ids:
+            return
+        
+        try:
+            celery_app.control.revoke(task_ids)
+        except Exception as e:
+            logging.error(f"Task revoke error: {e}")
@@ -1,10 +1,39 @@
 import os
+import orjson
+import hashlib
 import logging
+import requests
 import tweepy
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from typing import List, Dict, Any, Optional, Tuple
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from app import db
 from models import TrendingHashtag
+from services import cache
+
+# Number of trending hashtags stored and served
+TRENDING_LIMIT = 10
+
+TRENDING_CACHE_TTL = 300  # seconds
+
+# Most tweet ids GET /2/tweets accepts in one request
+TWEET_LOOKUP_BATCH_SIZE = 100
+
+@lru_cache(maxsize=1024)
+def _build_user_client(consumer_key: str, consumer_secret: str,
+                       access_token: str, access_token_secret: str) -> tweepy.Client:
+    """User-authenticated client, memoized per token so its keep-alive connections are reused"""
+    client = tweepy.Client(
+        consumer_key=consumer_key,
+        consumer_secret=consumer_secret,
+        access_token=access_token,
+        access_token_secret=access_token_secret
+    )
+    client.session.mount('https://', HTTPAdapter(pool_connections=50, pool_maxsize=50))
+    return client
 
 class TwitterService:
     def __init__(self):
@@ -14,6 +43,7 @@ class TwitterService:
         
         # Initialize API v2 client for read operations
         self.client = tweepy.Client(bearer_token=self.bearer_token)
+        self.client.session.mount('https://', HTTPAdapter(pool_connections=20, pool_maxsize=50))
         
         # OAuth 1.0a handler for write operations
         self.auth = tweepy.OAuth1UserHandler(
@@ -55,20 +85,9 @@ class TwitterService:
     def post_tweet(self, content: str, access_token: str, access_token_secret: str) -> str:
         """Post a tweet using user's credentials"""
         try:
-            # Create authenticated API instance
-            auth = tweepy.OAuth1UserHandler(
-                self.consumer_key,
-                self.consumer_secret,
-                access_token,
-                access_token_secret
-            )
-            
-            api = tweepy.API(auth)
-            client = tweepy.Client(
-                consumer_key=self.consumer_key,
-                consumer_secret=self.consumer_secret,
-                access_token=access_token,
-                access_token_secret=access_token_secret
+            # Reuse the user's authenticated client
+            client = _build_user_client(
+                self.consumer_key, self.consumer_secret, access_token, access_token_secret
             )
             
             # Post the tweet
@@ -78,63 +97,127 @@ class TwitterService:
                 return response.data['id']
             else:
                 raise Exception("No tweet ID returned")
-                
+        
+        except (tweepy.TweepyException, requests.RequestException) as e:
+            # Callers tell auth failures from transient ones by type
+            logging.error(f"Tweet posting error: {e}")
+            raise
         except Exception as e:
             logging.error(f"Tweet posting error: {e}")
             raise Exception(f"Failed to post tweet: {str(e)}")
     
     def get_trending_hashtags(self, location_woeid: int = 1) -> List[str]:
         """Get trending hashtags (cached for performance)"""
+        hashtags, _ = self.get_cached_trending(location_woeid)
+        return hashtags
+    
+    def refresh_trending_hashtags(self, location_woeid: int = 1) -> List[str]:
+        """Reload trending hashtags and overwrite the cached copy once the new rows are committed"""
+        hashtags = self._load_trending_hashtags(location_woeid)
+        self._cache_trending(location_woeid, hashtags)
+        return hashtags
+    
+    def _load_trending_hashtags(self, location_woeid: int) -> List[str]:
+        """Trending hashtags from the database, fetched from Twitter when the stored ones are stale"""
         try:
-            # Check if we have recent trending data (less than 1 hour old)
-            recent_trends = TrendingHashtag.query.filter(
-                TrendingHashtag.updated_at > datetime.utcnow() - timedelta(hours=1)
-            ).order_by(TrendingHashtag.trend_rank).limit(10).all()
+            # Check if we have recent trending data (less than 1 hour old), only the names are needed
+            hashtags = db.session.scalars(
+                select(TrendingHashtag.hashtag).where(
+                    TrendingHashtag.updated_at > datetime.now(timezone.utc) - timedelta(hours=1)
+                ).order_by(TrendingHashtag.trend_rank).limit(TRENDING_LIMIT)
+            ).all()
             
-            if recent_trends:
-                return [trend.hashtag for trend in recent_trends]
+            if hashtags:
+                return hashtags
             
             # Fetch new trending data
             trends = self.client.get_trending(id=location_woeid)
             
             if trends and trends.data:
-                # Clear old trends
-                TrendingHashtag.query.delete()
+                # Keep only the top hashtag trends, the scan stops once enough are found
+                hashtag_trends = (
+                    (i + 1, trend) for i, trend in enumerate(trends.data[:20])
+                    if trend.get('name', '').startswith('#')
+                )
+                rows = {}
+                for rank, trend in hashtag_trends:
+                    if trend['name'] in rows:
+                        continue
+                    rows[trend['name']] = {
+                        'hashtag': trend['name'],
+                        'tweet_volume': trend.get('tweet_volume'),
+                        'trend_rank': rank,
+                        'location': 'Global'
+                    }
+                    if len(rows) == TRENDING_LIMIT:
+                        break
+                
+                # Upsert them in one multi-row statement, keyed by hashtag
+                
+                if rows:
+                    stmt = pg_insert(TrendingHashtag).values(list(rows.values()))
+                    db.session.execute(stmt.on_conflict_do_update(
+                        index_elements=['hashtag'],
+                        set_={
+                            'tweet_volume': stmt.excluded.tweet_volume,
+                            'trend_rank': stmt.excluded.trend_rank,
+                            'location': stmt.excluded.location,
+                            'updated_at': func.now()
+                        }
+                    ))
                 
-                # Save new trends
-                trending_hashtags = []
-                for i, trend in enumerate(trends.data[:20]):
-                    hashtag = trend.get('name', '')
-                    if hashtag.startswith('#'):
-                        trend_obj = TrendingHashtag(
-                            hashtag=hashtag,
-                            tweet_volume=trend.get('tweet_volume'),
-                            trend_rank=i + 1,
-                            location='Global'
-                        )
-                        db.session.add(trend_obj)
-                        trending_hashtags.append(hashtag)
+                # Drop only the trends that fell out of this fetch
+                TrendingHashtag.query.filter(
+                    TrendingHashtag.hashtag.notin_(list(rows))
+                ).delete(synchronize_session=False)
                 
                 db.session.commit()
-                return trending_hashtags[:10]
+                return list(rows)
             
             return []
             
         except Exception as e:
             logging.error(f"Trending hashtags error: {e}")
             # Return cached data if available
-            cached_trends = TrendingHashtag.query.order_by(TrendingHashtag.trend_rank).limit(10).all()
-            return [trend.hashtag for trend in cached_trends]
+            return db.session.scalars(
+                select(TrendingHashtag.hashtag).order_by(TrendingHashtag.trend_rank).limit(TRENDING_LIMIT)
+            ).all()
+    
+    def get_trending_payload(self, location_woeid: int = 1) -> Tuple[bytes, str, bool]:
+        """Get trending hashtags as a JSON array together with its ETag.
+
+        Both are cached in Redis under one key so repeat reads skip serialization.
+        Returns the JSON bytes, the ETag and whether they were served from the cache.
+        """
+        cached = cache.get_fields(f"trending:{location_woeid}")
+        if cached and b'body' in cached and b'etag' in cached:
+            return cached[b'body'], cached[b'etag'].decode(), True
+        
+        body, etag = self._cache_trending(location_woeid, self._load_trending_hashtags(location_woeid))
+        return body, etag, False
+    
+    def get_cached_trending(self, location_woeid: int = 1) -> Tuple[List[str], bool]:
+        """Get trending hashtags from Redis, falling back to get_trending_hashtags on a miss.
+
+        Returns the hashtags and whether they were served from the cache.
+        """
+        body, _, cache_hit = self.get_trending_payload(location_woeid)
+        return orjson.loads(body), cache_hit
+    
+    def _cache_trending(self, location_woeid: int, hashtags: List[str]) -> Tuple[bytes, str]:
+        """Serialize hashtags and their ETag into the one trending cache entry every reader uses"""
+        body = orjson.dumps(hashtags)
+        etag = hashlib.blake2b(body, digest_size=8).hexdigest()
+        if hashtags:
+            cache.set_fields(f"trending:{location_woeid}", {'body': body, 'etag': etag}, TRENDING_CACHE_TTL)
+        return body, etag
     
     def get_tweet_analytics(self, tweet_id: str, access_token: str, access_token_secret: str) -> Dict[str, Any]:
         """Get analytics for a specific tweet"""
         try:
-            # Create authenticated client
-            client = tweepy.Client(
-                consumer_key=self.consumer_key,
-                consumer_secret=self.consumer_secret,
-                access_token=access_token,
-                access_token_secret=access_token_secret
+            # Reuse the user's authenticated client
+            client = _build_user_client(
+                self.consumer_key, self.consumer_secret, access_token, access_token_secret
             )
             
             # Get tweet data with metrics
@@ -145,14 +228,7 @@ class TwitterService:
             )
             
             if tweet.data:
-                metrics = tweet.data.public_metrics
-                return {
-                    'likes': metrics.get('like_count', 0),
-                    'retweets': metrics.get('retweet_count', 0),
-                    'replies': metrics.get('reply_count', 0),
-                    'impressions': metrics.get('impression_count', 0),
-                    'created_at': tweet.data.created_at
-                }
+                return self._tweet_metrics(tweet.data)
             
             return {}
             
@@ -160,6 +236,41 @@ class TwitterService:
             logging.error(f"Tweet analytics error: {e}")
             return {}
     
+    def get_tweets_analytics_bulk(self, tweet_ids: List[str], access_token: str,
+                                  access_token_secret: str) -> Dict[str, Dict[str, Any]]:
+        """Get analytics for many tweets of one user, up to 100 per request, keyed by tweet id"""
+        client = _build_user_client(
+            self.consumer_key, self.consumer_secret, access_token, access_token_secret
+        )
+        
+        analytics = {}
+        for i in range(0, len(tweet_ids), TWEET_LOOKUP_BATCH_SIZE):
+            chunk = tweet_ids[i:i + TWEET_LOOKUP_BATCH_SIZE]
+            try:
+                tweets = client.get_tweets(
+                    ids=chunk,
+                    tweet_fields=['public_metrics', 'created_at']
+                )
+            except Exception as e:
+                logging.error(f"Tweet analytics error for {len(chunk)} tweets: {e}")
+                continue
+            
+            # Deleted or protected tweets are simply absent from the response
+            for tweet in tweets.data or []:
+                analytics[str(tweet.id)] = self._tweet_metrics(tweet)
+        
+        return analytics
+    
+    def _tweet_metrics(self, tweet: tweepy.Tweet) -> Dict[str, Any]:
+        metrics = tweet.public_metrics
+        return {
+            'likes': metrics.get('like_count', 0),
+            'retweets': metrics.get('retweet_count', 0),
+            'replies': metrics.get('reply_count', 0),
+            'impressions': metrics.get('impression_count', 0),
+            'created_at': tweet.created_at
+        }
+    
     def search_tweets(self, query: str, max_results: int = 10) -> List[Dict[str, Any]]:
         """Search for tweets with specific query"""
         try:
@@ -191,11 +302,8 @@ class TwitterService:
     def validate_credentials(self, access_token: str, access_token_secret: str) -> bool:
         """Validate Twitter credentials"""
         try:
-            client = tweepy.Client(
-                consumer_key=self.consumer_key,
-                consumer_secret=self.consumer_secret,
-                access_token=access_token,
-                access_token_secret=access_token_secret
+            client = _build_user_client(
+                self.consumer_key, self.consumer_secret, access_token, access_token_secret
             )
             
             # Try to get user info to validate credentials
@@ -205,3 +313,8 @@ class TwitterService:
         except Exception as e:
             logging.error(f"Credential validation error: {e}")
             return False
+
+@lru_cache(maxsize=1)
+def get_twitter_service() -> TwitterService:
+    """Shared TwitterService instance, so the app client and its connection pool are built once per process"""
+    return TwitterService()
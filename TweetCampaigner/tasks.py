@@ -1,36 +1,106 @@
+import sys
 import logging
-from datetime import datetime, timedelta
+from random import uniform
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from datetime import datetime, timedelta, timezone
+
+# The eventlet pool monkey-patches the worker before this module is loaded;
+# psycopg2 needs its own patch to yield while waiting on the database
+_eventlet = sys.modules.get('eventlet')
+if _eventlet and _eventlet.patcher.is_monkey_patched('socket'):
+    from psycogreen.eventlet import patch_psycopg
+    patch_psycopg()
+
+import requests
+import tweepy
 from celery import Celery
+from celery.exceptions import Retry
+from celery.signals import worker_process_init
+from sqlalchemy import event, tuple_
+from sqlalchemy.orm import Session, joinedload
 from app import app, db
 from models import ScheduledTweet, User, TweetAnalytics, TrendingHashtag
-from services.twitter_service import TwitterService
+from services.twitter_service import get_twitter_service
 from services.analytics_service import AnalyticsService
 
 # Create Celery instance
 celery_app = Celery('twitter_campaign_manager')
 celery_app.config_from_object('celery_app')
 
-twitter_service = TwitterService()
+@worker_process_init.connect
+def _reset_db_pool(**kwargs):
+    """Give each forked worker its own connection pool"""
+    # The parent connected at import (db.create_all), drop the inherited sockets without closing them
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+twitter_service = get_twitter_service()
 analytics_service = AnalyticsService()
 
+# Concurrent Twitter requests per batch analytics run, kept low for the API rate limits
+ANALYTICS_FETCH_WORKERS = 10
+
+# Posted tweets fetched, looked up and written per batch analytics page
+ANALYTICS_PAGE_SIZE = 1000
+
+# Longest wait before a task retry, in seconds
+RETRY_BACKOFF_CAP = 600
+
+def _retry_countdown(retries: int, base: int) -> float:
+    """Exponential backoff with full jitter, so retries after an outage don't arrive together"""
+    return min(RETRY_BACKOFF_CAP, uniform(0, base * 2 ** retries))
+
+def _enqueue_after_commit(signature):
+    """Send a task once the current transaction commits, it is dropped if the transaction rolls back"""
+    db.session.info.setdefault('after_commit_tasks', []).append(signature)
+
+@event.listens_for(Session, 'after_commit')
+def _send_after_commit_tasks(session):
+    # A broker error must not undo or fail work that is already committed
+    for signature in session.info.pop('after_commit_tasks', []):
+        try:
+            signature.apply_async()
+        except Exception as e:
+            logging.error(f"Failed to enqueue {signature.task}: {e}")
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_after_commit_tasks(session):
+    session.info.pop('after_commit_tasks', None)
+
+# A tweet still 'posting' after this many minutes lost its worker
+STALE_POSTING_MINUTES = 15
+
+# Posting failures worth retrying, anything else fails the tweet straight away
+TRANSIENT_POSTING_ERRORS = (
+    tweepy.errors.TooManyRequests,
+    tweepy.errors.TwitterServerError,
+    requests.RequestException
+)
+
 @celery_app.task(bind=True, max_retries=3)
 def schedule_tweet_task(self, scheduled_tweet_id):
     """Background task to post a scheduled tweet"""
     try:
         with app.app_context():
-            # Get the scheduled tweet
-            scheduled_tweet = ScheduledTweet.query.get(scheduled_tweet_id)
+            # Lock the scheduled tweet together with its user's credentials; a row another
+            # worker holds, or one already posted or cancelled, is not ours to post
+            scheduled_tweet = ScheduledTweet.query.options(
+                joinedload(ScheduledTweet.user)
+            ).filter_by(
+                id=scheduled_tweet_id, status='scheduled'
+            ).with_for_update(skip_locked=True, of=ScheduledTweet).first()
             if not scheduled_tweet:
-                logging.error(f"Scheduled tweet {scheduled_tweet_id} not found")
+                logging.info(f"Tweet {scheduled_tweet_id} is not waiting to be posted, skipping")
                 return
             
-            # Check if already posted or cancelled
-            if scheduled_tweet.status != 'scheduled':
-                logging.info(f"Tweet {scheduled_tweet_id} status is {scheduled_tweet.status}, skipping")
+            # A paused and resumed tweet is re-queued under a new task, a stale copy must not post it
+            if scheduled_tweet.task_id and scheduled_tweet.task_id != self.request.id:
+                logging.info(f"Task {self.request.id} superseded for tweet {scheduled_tweet_id}, skipping")
                 return
             
             # Get user's Twitter credentials
-            user = User.query.get(scheduled_tweet.user_id)
+            user = scheduled_tweet.user
             if not user or not user.has_twitter_auth():
                 scheduled_tweet.status = 'failed'
                 scheduled_tweet.error_message = 'Twitter authentication required'
@@ -38,50 +108,69 @@ def schedule_tweet_task(self, scheduled_tweet_id):
                 logging.error(f"User {scheduled_tweet.user_id} missing Twitter auth")
                 return
             
-            # Validate credentials before posting
-            if not twitter_service.validate_credentials(
-                user.twitter_access_token, 
-                user.twitter_access_token_secret
-            ):
-                scheduled_tweet.status = 'failed'
-                scheduled_tweet.error_message = 'Invalid Twitter credentials'
-                db.session.commit()
-                logging.error(f"Invalid Twitter credentials for user {user.id}")
-                return
+            # Read what the post needs now, the commit below expires the loaded rows
+            content = scheduled_tweet.content
+            access_token = user.twitter_access_token
+            access_token_secret = user.twitter_access_token_secret
+            
+            # Claim the tweet before calling Twitter, so no other run can post it too
+            scheduled_tweet.status = 'posting'
+            scheduled_tweet.claimed_at = datetime.utcnow()
+            db.session.commit()
             
-            # Post the tweet
+            # Post the tweet, bad credentials surface as a 401 here
             try:
-                tweet_id = twitter_service.post_tweet(
-                    scheduled_tweet.content,
-                    user.twitter_access_token,
-                    user.twitter_access_token_secret
-                )
+                tweet_id = twitter_service.post_tweet(content, access_token, access_token_secret)
+                
+                # Schedule analytics collection once the posted status is committed
+                _enqueue_after_commit(collect_tweet_analytics.signature(
+                    args=[tweet_id, scheduled_tweet.user_id, scheduled_tweet.campaign_id],
+                    countdown=300  # Wait 5 minutes before collecting initial analytics
+                ))
                 
                 # Update the scheduled tweet record
                 scheduled_tweet.status = 'posted'
                 scheduled_tweet.tweet_id = tweet_id
                 scheduled_tweet.posted_at = datetime.utcnow()
+                scheduled_tweet.claimed_at = None
                 scheduled_tweet.error_message = None
                 
                 db.session.commit()
                 
-                # Schedule analytics collection
-                collect_tweet_analytics.apply_async(
-                    args=[tweet_id, user.id, scheduled_tweet.campaign_id],
-                    countdown=300  # Wait 5 minutes before collecting initial analytics
-                )
-                
                 logging.info(f"Successfully posted tweet {scheduled_tweet_id} as {tweet_id}")
                 
+            except tweepy.errors.Unauthorized as e:
+                scheduled_tweet.status = 'failed'
+                scheduled_tweet.error_message = 'Invalid Twitter credentials'
+                scheduled_tweet.claimed_at = None
+                db.session.commit()
+                logging.error(f"Invalid Twitter credentials for user {scheduled_tweet.user_id}: {e}")
+            
+            except TRANSIENT_POSTING_ERRORS as e:
+                scheduled_tweet.error_message = str(e)
+                scheduled_tweet.claimed_at = None
+                logging.error(f"Failed to post tweet {scheduled_tweet_id}: {e}")
+                
+                # Hand the tweet back so the retry can claim it again
+                if self.request.retries < self.max_retries:
+                    scheduled_tweet.status = 'scheduled'
+                    db.session.commit()
+                    raise self.retry(countdown=_retry_countdown(self.request.retries, 60))
+                
+                scheduled_tweet.status = 'failed'
+                db.session.commit()
+            
             except Exception as e:
                 # Handle posting error
                 scheduled_tweet.status = 'failed'
                 scheduled_tweet.error_message = str(e)
+                scheduled_tweet.claimed_at = None
                 db.session.commit()
                 
                 logging.error(f"Failed to post tweet {scheduled_tweet_id}: {e}")
-                raise self.retry(countdown=60 * (2 ** self.request.retries))
     
+    except Retry:
+        raise
     except Exception as e:
         logging.error(f"Tweet posting task error: {e}")
         # Don't retry on unexpected errors
@@ -120,15 +209,15 @@ def collect_tweet_analytics(self, tweet_id, user_id, campaign_id=None):
     except Exception as e:
         logging.error(f"Analytics collection error: {e}")
         if self.request.retries < self.max_retries:
-            raise self.retry(countdown=300)  # Retry after 5 minutes
+            raise self.retry(countdown=_retry_countdown(self.request.retries, 300))
 
 @celery_app.task
 def refresh_trending_hashtags():
     """Periodic task to refresh trending hashtags"""
     try:
         with app.app_context():
-            # This will update the database with fresh trending data
-            trending_hashtags = twitter_service.get_trending_hashtags()
+            # Updates the database with fresh trending data, then the cache from it
+            trending_hashtags = twitter_service.refresh_trending_hashtags()
             logging.info(f"Refreshed {len(trending_hashtags)} trending hashtags")
     
     except Exception as e:
@@ -142,30 +231,48 @@ def cleanup_old_data():
             # Clean up old scheduled tweets (completed > 30 days ago)
             cutoff_date = datetime.utcnow() - timedelta(days=30)
             
-            old_tweets = ScheduledTweet.query.filter(
+            deleted_tweets = ScheduledTweet.query.filter(
                 ScheduledTweet.posted_at < cutoff_date,
                 ScheduledTweet.status.in_(['posted', 'failed'])
-            ).all()
-            
-            for tweet in old_tweets:
-                db.session.delete(tweet)
+            ).delete(synchronize_session=False)
             
             # Clean up old trending hashtags (> 24 hours old)
-            yesterday = datetime.utcnow() - timedelta(hours=24)
-            old_trends = TrendingHashtag.query.filter(
+            yesterday = datetime.now(timezone.utc) - timedelta(hours=24)
+            deleted_trends = TrendingHashtag.query.filter(
                 TrendingHashtag.updated_at < yesterday
-            ).all()
-            
-            for trend in old_trends:
-                db.session.delete(trend)
+            ).delete(synchronize_session=False)
             
             db.session.commit()
-            logging.info(f"Cleaned up {len(old_tweets)} old tweets and {len(old_trends)} old trends")
+            logging.info(f"Cleaned up {deleted_tweets} old tweets and {deleted_trends} old trends")
     
     except Exception as e:
         db.session.rollback()
         logging.error(f"Data cleanup error: {e}")
 
+def _fetch_user_analytics(tweets):
+    """Fetch metrics for one user's posted tweets as bulk_upsert_analytics rows"""
+    credentials = tweets[0]
+    try:
+        analytics = twitter_service.get_tweets_analytics_bulk(
+            [tweet.tweet_id for tweet in tweets],
+            credentials.twitter_access_token,
+            credentials.twitter_access_token_secret
+        )
+    except Exception as e:
+        logging.error(f"Failed to update analytics for user {credentials.user_id}: {e}")
+        return []
+    
+    return [
+        dict(
+            analytics[tweet.tweet_id],
+            tweet_id=tweet.tweet_id,
+            user_id=tweet.user_id,
+            campaign_id=tweet.campaign_id
+        )
+        for tweet in tweets
+        if tweet.tweet_id in analytics
+    ]
+
 @celery_app.task
 def batch_analytics_update():
     """Periodic task to update analytics for recent tweets"""
@@ -174,41 +281,110 @@ def batch_analytics_update():
             # Get tweets posted in the last 24 hours that need analytics update
             yesterday = datetime.utcnow() - timedelta(hours=24)
             
-            recent_tweets = db.session.query(ScheduledTweet, User).join(
+            # Read in pages rather than loaded whole, a busy day can post many tweets. Each page is
+            # written before the next is read, so pages are keyset-paginated instead of one
+            # server-side cursor, which the per-page commit would close.
+            recent_tweets = db.session.query(
+                ScheduledTweet.id,
+                ScheduledTweet.tweet_id,
+                ScheduledTweet.campaign_id,
+                User.id.label('user_id'),
+                User.twitter_access_token,
+                User.twitter_access_token_secret
+            ).join(
                 User, ScheduledTweet.user_id == User.id
             ).filter(
                 ScheduledTweet.status == 'posted',
                 ScheduledTweet.posted_at >= yesterday,
                 User.twitter_access_token.isnot(None)
-            ).all()
-            
-            updated_count = 0
-            for tweet, user in recent_tweets:
-                try:
-                    analytics_data = twitter_service.get_tweet_analytics(
-                        tweet.tweet_id,
-                        user.twitter_access_token,
-                        user.twitter_access_token_secret
-                    )
-                    
-                    if analytics_data:
-                        analytics_service.update_tweet_analytics(
-                            tweet.tweet_id,
-                            analytics_data,
-                            user.id,
-                            tweet.campaign_id
+            ).order_by(ScheduledTweet.user_id, ScheduledTweet.id)
+            
+            updated = 0
+            last_seen = None
+            
+            # Twitter calls are network bound, run several users at once
+            with ThreadPoolExecutor(max_workers=ANALYTICS_FETCH_WORKERS) as executor:
+                while True:
+                    page_query = recent_tweets
+                    if last_seen:
+                        page_query = page_query.filter(
+                            tuple_(ScheduledTweet.user_id, ScheduledTweet.id) > last_seen
                         )
-                        updated_count += 1
-                
-                except Exception as e:
-                    logging.error(f"Failed to update analytics for tweet {tweet.tweet_id}: {e}")
-                    continue
+                    page = page_query.limit(ANALYTICS_PAGE_SIZE).all()
+                    if not page:
+                        break
+                    last_seen = (page[-1].user_id, page[-1].id)
+                    
+                    # Tweets are looked up in batches per user, since each user has their own credentials
+                    tweets_by_user = [
+                        list(tweets) for _, tweets in groupby(page, key=lambda tweet: tweet.user_id)
+                    ]
+                    pending = [
+                        analytics
+                        for rows in executor.map(_fetch_user_analytics, tweets_by_user)
+                        for analytics in rows
+                    ]
+                    
+                    # Write each page at once
+                    analytics_service.bulk_upsert_analytics(pending)
+                    updated += len(pending)
             
-            logging.info(f"Updated analytics for {updated_count} tweets")
+            logging.info(f"Updated analytics for {updated} tweets")
     
     except Exception as e:
         logging.error(f"Batch analytics update error: {e}")
 
+@celery_app.task
+def release_stale_posts():
+    """Periodic task to fail tweets whose posting worker died mid-attempt"""
+    with app.app_context():
+        try:
+            # Whether Twitter accepted the tweet is unknown, so it is failed rather than posted again
+            cutoff = datetime.utcnow() - timedelta(minutes=STALE_POSTING_MINUTES)
+            # claimed_at is only set while an attempt is in flight, so the scan stays small
+            released = ScheduledTweet.query.filter(
+                ScheduledTweet.claimed_at < cutoff,
+                ScheduledTweet.status == 'posting'
+            ).update({
+                'status': 'failed',
+                'claimed_at': None,
+                'error_message': 'Posting was interrupted, check the account before rescheduling'
+            }, synchronize_session=False)
+            
+            db.session.commit()
+            if released:
+                logging.warning(f"Released {released} interrupted tweet posts")
+        
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Stale post release error: {e}")
+
+@celery_app.task
+def refresh_daily_analytics():
+    """Periodic task to rebuild the daily activity rollup"""
+    with app.app_context():
+        try:
+            analytics_service.refresh_daily_activity()
+            logging.info("Refreshed daily analytics")
+        
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Daily analytics refresh error: {e}")
+
+@celery_app.task
+def refresh_campaign_insights(campaign_id):
+    """Generate and cache AI insights for a campaign off the request path"""
+    # Imported here, campaign_service imports this module
+    from services.campaign_service import CampaignService
+    
+    try:
+        with app.app_context():
+            insights = CampaignService().refresh_campaign_insights(campaign_id)
+            logging.info(f"Refreshed {len(insights)} insights for campaign {campaign_id}")
+    
+    except Exception as e:
+        logging.error(f"Campaign insights refresh error: {e}")
+
 # Periodic task schedule
 from celery.schedules import crontab
 
@@ -225,6 +401,14 @@ celery_app.conf.beat_schedule = {
         'task': 'tasks.cleanup_old_data',
         'schedule': crontab(minute=0, hour=2),  # Daily at 2 AM
     },
+    'release-stale-posts': {
+        'task': 'tasks.release_stale_posts',
+        'schedule': crontab(minute='*/15'),  # Every 15 minutes
+    },
+    'refresh-daily-analytics': {
+        'task': 'tasks.refresh_daily_analytics',
+        'schedule': crontab(minute=30, hour=2),  # Daily at 2:30 AM, after cleanup
+    },
 }
 
 celery_app.conf.timezone = 'UTC'